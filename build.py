@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 
 import os
-import pathlib
+import re
+import glob
+import json
 import platform
 import zipfile
 import urllib.request
@@ -9,8 +11,22 @@ import shutil
 import hashlib
 import argparse
 import sys
+import io
+import tarfile
+import tempfile
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
 
+try:
+    import resource
+except ImportError:
+    # windows
+    resource = None
+
 windows = platform.platform().startswith('Windows')
 osx = platform.platform().startswith(
     'Darwin') or platform.platform().startswith("macOS")
@@ -24,6 +40,23 @@ else:
     flutter_build_dir = 'build/linux/x64/release/bundle/'
 flutter_build_dir_2 = f'flutter/{flutter_build_dir}'
 skip_cargo = False
+deb_sha256sums = False
+deb_compression = 'xz'
+build_cache_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'target', 'build_cache.json')
+use_build_cache = True
+explain_build_cache = False
+build_cache_lock = threading.Lock()
+# name of the step running in this thread, set when steps run concurrently
+current_step = threading.local()
+virtual_display_dll = 'target/release/deps/dylib_virtual_display.dll'
+download_cache_dir = os.environ.get(
+    'RUSTDESK_DOWNLOAD_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'rustdesk-build', 'downloads'))
+download_mirror = None
+# finished timing spans, kept when --trace is given
+spans = None
+spans_lock = threading.Lock()
+trace_start = time.perf_counter()
 
 
 def get_deb_arch() -> str:
@@ -38,13 +71,285 @@ def get_deb_extra_depends() -> str:
         return ", libatomic1"
     return ""
 
-def system2(cmd):
-    exit_code = os.system(cmd)
+def log(msg):
+    name = getattr(current_step, 'name', None)
+    print(f'[{name}] {msg}' if name else msg, flush=True)
+
+
+def children_cpu():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+@contextmanager
+def span(name, cat):
+    """Time the block, yield a dict of extra args to record with it.
+
+    Child CPU time is the rusage of the children waited for meanwhile, it
+    includes those of other steps when steps run concurrently.
+    """
+    if spans is None:
+        yield {}
+        return
+    args = {}
+    start = time.perf_counter()
+    cpu = children_cpu()
+    try:
+        yield args
+    finally:
+        end = time.perf_counter()
+        if cpu is not None:
+            args['child_cpu_s'] = round(children_cpu() - cpu, 3)
+        with spans_lock:
+            spans.append({
+                'name': name,
+                'cat': cat,
+                'start': start - trace_start,
+                'wall': end - start,
+                'tid': threading.get_ident(),
+                'args': args,
+            })
+
+
+def write_trace(path):
+    """Write spans as chrome trace json (chrome://tracing, ui.perfetto.dev)
+    and print them sorted by wall time."""
+    events = [{
+        'name': s['name'],
+        'cat': s['cat'],
+        'ph': 'X',
+        'ts': round(s['start'] * 1e6),
+        'dur': round(s['wall'] * 1e6),
+        'pid': os.getpid(),
+        'tid': s['tid'],
+        'args': s['args'],
+    } for s in spans]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    print(f'{"wall s":>9} {"child cpu s":>11} {"exit":>4}  step')
+    for s in sorted(spans, key=lambda s: -s['wall']):
+        cpu = s['args'].get('child_cpu_s')
+        name = s['name'] if len(s['name']) <= 72 else s['name'][:69] + '...'
+        print(f'{s["wall"]:9.2f} {"" if cpu is None else f"{cpu:.2f}":>11} '
+              f'{s["args"].get("exit_code", ""):>4}  {s["cat"]}: {name}')
+    print(f'trace location: {os.path.abspath(path)}')
+
+
+def system2(cmd, cwd=None):
+    with span(cmd, 'system2') as args:
+        if getattr(current_step, 'name', None) is None and cwd is None:
+            exit_code = os.system(cmd)
+            if not windows:
+                exit_code = os.waitstatus_to_exitcode(exit_code)
+        else:
+            prefix = getattr(current_step, 'name', None) is not None
+            proc = subprocess.Popen(cmd, shell=True, cwd=cwd,
+                                    stdout=subprocess.PIPE if prefix else None,
+                                    stderr=subprocess.STDOUT if prefix else None,
+                                    text=True, errors='replace')
+            if prefix:
+                for line in proc.stdout:
+                    log(line.rstrip('\n'))
+            exit_code = proc.wait()
+        args['exit_code'] = exit_code
     if exit_code != 0:
-        sys.stderr.write(f"Error occurred when executing: `{cmd}`. Exiting.\n")
+        name = getattr(current_step, 'name', None)
+        sys.stderr.write(f"{f'[{name}] ' if name else ''}Error occurred when executing: `{cmd}`. Exiting.\n")
         sys.exit(-1)
 
 
+# Steps are skipped when their command, environment, input and output files
+# are the same as in the last successful run, recorded in build_cache_file.
+# Paths are relative to the repository root.
+
+
+def load_build_cache():
+    try:
+        with open(build_cache_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_build_cache(cache):
+    os.makedirs(os.path.dirname(build_cache_file), exist_ok=True)
+    tmp = build_cache_file + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp, build_cache_file)
+
+
+def hash_paths(patterns):
+    """{file: md5} of the files matched by the glob patterns, directories are
+    walked."""
+    files = set()
+    for pattern in patterns:
+        for path in glob.glob(pattern, recursive=True):
+            if os.path.isdir(path):
+                files.update(f.as_posix() for f in Path(path).rglob('*') if f.is_file())
+            elif os.path.isfile(path):
+                files.add(Path(path).as_posix())
+    files = sorted(files)
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        digests = executor.map(lambda f: hash_file(f)[0], files)
+    return dict(zip(files, digests))
+
+
+def step_changed(last, record):
+    """Why a step has to run again, None if it is up to date."""
+    if last is None:
+        return 'no previous run'
+    if last['cmd'] != record['cmd']:
+        return f'command changed: `{last["cmd"]}` -> `{record["cmd"]}`'
+    for (name, value) in record['env'].items():
+        if last['env'].get(name) != value:
+            return f'environment variable {name} changed'
+    for (kind, old, new) in (('input', last['inputs'], record['inputs']),
+                             ('output', last['outputs'], record['outputs'])):
+        for path in sorted(old.keys() | new.keys()):
+            if path not in new:
+                return f'{kind} {path} removed'
+            if path not in old:
+                return f'{kind} {path} added'
+            if old[path] != new[path]:
+                return f'{kind} {path} changed'
+    return None
+
+
+def cached_step(name, run, cmd, inputs, outputs, env=()):
+    """Call run() unless the step is up to date.
+
+    cmd describes what run() does, usually its command line; inputs and
+    outputs are glob patterns, inputs may also be the {file: md5} already
+    hashed by the caller; env are the names of the environment variables
+    the step reads.
+    """
+    record = {
+        'cmd': cmd,
+        'env': {k: os.environ.get(k) for k in env},
+        'inputs': inputs if isinstance(inputs, dict) else hash_paths(inputs),
+    }
+    if use_build_cache:
+        record['outputs'] = hash_paths(outputs)
+        missing = [o for o in outputs if not glob.glob(o, recursive=True)]
+        reason = f'output {missing[0]} missing' if missing else step_changed(
+            load_build_cache().get(name), record)
+        if reason is None:
+            log(f'{name}: up to date, skipped')
+            return
+    else:
+        reason = 'cache disabled'
+    if explain_build_cache:
+        log(f'{name}: running, {reason}')
+    with span(name, 'cached'):
+        run()
+    record['outputs'] = hash_paths(outputs)
+    # steps may finish concurrently
+    with build_cache_lock:
+        cache = load_build_cache()
+        cache[name] = record
+        save_build_cache(cache)
+
+
+# The build is a graph of steps. A step depends on the steps listed in
+# after and on every step with an output that is, or is under, one of its
+# inputs. Independent steps run concurrently, up to -j at a time.
+
+
+class Step:
+    def __init__(self, name, run, inputs=(), outputs=(), after=()):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.after = list(after)
+
+
+def path_prefix(pattern):
+    """The literal directory part of a glob pattern."""
+    parts = []
+    for part in Path(pattern).parts:
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return Path(*parts) if parts else Path('.')
+
+
+def step_dependencies(steps):
+    """{step name: set of names it waits for}, steps in topological order."""
+    deps = {}
+    for step in steps:
+        deps[step.name] = set(step.after)
+        for other in steps:
+            if other is step:
+                continue
+            for i in step.inputs:
+                for o in other.outputs:
+                    i_path, o_path = path_prefix(i), path_prefix(o)
+                    if i_path == o_path or i_path in o_path.parents or o_path in i_path.parents:
+                        deps[step.name].add(other.name)
+    order = []
+    done = set()
+    while len(order) < len(steps):
+        ready = [s for s in steps if s.name not in done and deps[s.name] <= done]
+        if not ready:
+            raise Exception('Build steps have a dependency cycle: ' +
+                            ', '.join(s.name for s in steps if s.name not in done))
+        order += ready
+        done.update(s.name for s in ready)
+    return deps, order
+
+
+def print_plan(steps):
+    deps, order = step_dependencies(steps)
+    for step in order:
+        print(step.name)
+        if deps[step.name]:
+            print(f'  after:   {", ".join(sorted(deps[step.name]))}')
+        if step.inputs:
+            print(f'  inputs:  {" ".join(step.inputs)}')
+        if step.outputs:
+            print(f'  outputs: {" ".join(step.outputs)}')
+
+
+def run_steps(steps, jobs=1):
+    deps, order = step_dependencies(steps)
+    if jobs == 1:
+        for step in order:
+            with span(step.name, 'step'):
+                step.run()
+        return
+    pending = {s.name: s for s in steps}
+    done = set()
+    running = {}
+
+    def run(step):
+        # only prefix output when it can interleave
+        current_step.name = step.name if jobs > 1 else None
+        try:
+            with span(step.name, 'step'):
+                step.run()
+        finally:
+            current_step.name = None
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            for name in [n for n in pending if deps[n] <= done]:
+                if len(running) >= jobs:
+                    break
+                running[executor.submit(run, pending.pop(name))] = name
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    # let the other running steps finish, then fail
+                    wait(running)
+                    raise future.exception()
+                done.add(name)
+
+
 def get_version():
     with open("Cargo.toml", encoding="utf-8") as fh:
         for line in fh:
@@ -144,6 +449,59 @@ def make_parser():
         "--package",
         type=str
     )
+    parser.add_argument(
+        '--sha256sums',
+        action='store_true',
+        help='Also write DEBIAN/sha256sums into deb packages'
+    )
+    parser.add_argument(
+        '--deb-compression',
+        choices=['xz', 'zstd', 'gzip'],
+        default='xz',
+        help='Compression of the deb tarballs, default is xz. zstd needs dpkg >= 1.21.18 to install'
+    )
+    parser.add_argument(
+        '--no-build-cache',
+        action='store_true',
+        help='Run every build step even if its inputs did not change'
+    )
+    parser.add_argument(
+        '--explain',
+        action='store_true',
+        help='Print why each cached build step runs'
+    )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=1,
+        help='Number of independent build steps to run at the same time, default is 1. '
+             'Output of concurrent steps is prefixed by the step name'
+    )
+    parser.add_argument(
+        '--download-mirror',
+        metavar='URL',
+        help='Fetch feature zips and checksums from URL/<file name>, file:// works for offline builds. '
+             'Downloads are cached in $RUSTDESK_DOWNLOAD_CACHE, default is ~/.cache/rustdesk-build/downloads'
+    )
+    parser.add_argument(
+        '--formats',
+        type=parse_formats,
+        default=['deb'],
+        help=f'Package formats built by --package, comma separated, default is deb. '
+             f'Available: {",".join(PACKAGE_FORMATS)}'
+    )
+    parser.add_argument(
+        '--trace',
+        metavar='FILE',
+        help='Time every command and build step, write them to FILE as chrome trace json '
+             'and print a summary sorted by wall time'
+    )
+    parser.add_argument(
+        '--plan',
+        action='store_true',
+        help='Print the build steps and their dependencies without running them'
+    )
     if osx:
         parser.add_argument(
             '--screencapturekit',
@@ -192,42 +550,104 @@ def generate_build_script_for_docker():
 # Downloading third party resources is deprecated.
 # We can use this function in an offline build environment.
 # Even in an online environment, we recommend building third-party resources yourself.
+#
+# Downloads are kept in download_cache_dir as <md5>/<file name>, so a zip
+# is only fetched once per checksum. With --download-mirror, the zips and
+# checksum files are fetched from <mirror>/<file name> instead, e.g.
+# file:///mnt/mirror for offline builds.
+#
+# parse_rc_features lists no available features at the moment, so none of
+# this runs in a build until some are added there.
 def download_extract_features(features, res_dir):
-    import re
+    # each feature is extracted into a folder of its own, so concurrent
+    # extractions do not race, then moved into res_dir in feature order, the
+    # last feature wins as when extracted one by one
+    parent = os.path.dirname(os.path.abspath(res_dir))
+    os.makedirs(res_dir, exist_ok=True)
+    folders = [tempfile.mkdtemp(prefix=f'{feat}-', dir=parent) for feat in features]
+    try:
+        with ThreadPoolExecutor(max_workers=max(len(features), 1)) as executor:
+            for _ in executor.map(lambda item, folder: download_extract_feature(*item, folder),
+                                  features.items(), folders):
+                pass
+        for folder in folders:
+            move_tree(folder, res_dir)
+    finally:
+        for folder in folders:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+def move_tree(src, dst):
+    """Move the content of src into dst, replacing files, by renames."""
+    for (root, dirs, files) in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target, exist_ok=True)
+        for name in files:
+            os.replace(os.path.join(root, name), os.path.join(target, name))
+
 
+def feature_request(url):
     proxy = ''
+    if download_mirror:
+        url = download_mirror.rstrip('/') + '/' + url.split('/')[-1]
+    if not proxy:
+        return url
+    else:
+        r = urllib.request.Request(url)
+        r.set_proxy(proxy, 'http')
+        r.set_proxy(proxy, 'https')
+        return r
 
-    def req(url):
-        if not proxy:
-            return url
-        else:
-            r = urllib.request.Request(url)
-            r.set_proxy(proxy, 'http')
-            r.set_proxy(proxy, 'https')
-            return r
-
-    for (feat, feat_info) in features.items():
-        includes = feat_info['include'] if 'include' in feat_info and feat_info['include'] else []
-        includes = [re.compile(p) for p in includes]
-        excludes = feat_info['exclude'] if 'exclude' in feat_info and feat_info['exclude'] else []
-        excludes = [re.compile(p) for p in excludes]
-
-        print(f'{feat} download begin')
-        download_filename = feat_info['zip_url'].split('/')[-1]
-        checksum_md5_response = urllib.request.urlopen(
-            req(feat_info['checksum_url']))
-        for line in checksum_md5_response.read().decode('utf-8').splitlines():
-            if line.split()[1] == download_filename:
-                checksum_md5 = line.split()[0]
-                filename, _headers = urllib.request.urlretrieve(feat_info['zip_url'],
-                                                                download_filename)
-                md5 = hashlib.md5(open(filename, 'rb').read()).hexdigest()
-                if checksum_md5 != md5:
-                    raise Exception(f'{feat} download failed')
-                print(f'{feat} download end. extract bein')
-                zip_file = zipfile.ZipFile(filename)
-                zip_list = zip_file.namelist()
-                for f in zip_list:
+
+def download_feature_file(feat, url, checksum_md5):
+    """Return the path of the cached download of url, fetching it if needed."""
+    download_filename = url.split('/')[-1]
+    cache_dir = os.path.join(download_cache_dir, checksum_md5)
+    path = os.path.join(cache_dir, download_filename)
+    if os.path.isfile(path):
+        if hash_file(path)[0] == checksum_md5:
+            log(f'{feat} found in download cache')
+            return path
+        log(f'{feat} cached download is corrupted, downloading again')
+    os.makedirs(cache_dir, exist_ok=True)
+    md5 = hashlib.md5()
+    # hash while streaming, the file is moved into the cache only once verified
+    with tempfile.NamedTemporaryFile(dir=cache_dir, delete=False) as f:
+        try:
+            with urllib.request.urlopen(feature_request(url)) as response:
+                for chunk in iter(lambda: response.read(1024 * 1024), b''):
+                    md5.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    if md5.hexdigest() != checksum_md5:
+        os.remove(f.name)
+        raise Exception(f'{feat} download failed')
+    os.replace(f.name, path)
+    return path
+
+
+def download_extract_feature(feat, feat_info, res_dir):
+    import re
+
+    includes = feat_info['include'] if 'include' in feat_info and feat_info['include'] else []
+    includes = [re.compile(p) for p in includes]
+    excludes = feat_info['exclude'] if 'exclude' in feat_info and feat_info['exclude'] else []
+    excludes = [re.compile(p) for p in excludes]
+
+    log(f'{feat} download begin')
+    download_filename = feat_info['zip_url'].split('/')[-1]
+    with urllib.request.urlopen(feature_request(feat_info['checksum_url'])) as checksum_md5_response:
+        checksum_lines = checksum_md5_response.read().decode('utf-8').splitlines()
+    for line in checksum_lines:
+        if line.split()[1] == download_filename:
+            checksum_md5 = line.split()[0]
+            filename = download_feature_file(feat, feat_info['zip_url'], checksum_md5)
+            log(f'{feat} download end. extract bein')
+            with zipfile.ZipFile(filename) as zip_file:
+                for f in zip_file.namelist():
                     file_exclude = False
                     for p in excludes:
                         if p.match(f) is not None:
@@ -242,11 +662,9 @@ def download_extract_features(features, res_dir):
                             file_include = True
                             break
                     if file_include:
-                        print(f'extract file {f}')
+                        log(f'extract file {f}')
                         zip_file.extract(f, res_dir)
-                zip_file.close()
-                os.remove(download_filename)
-                print(f'{feat} extract end')
+            log(f'{feat} extract end')
 
 
 def external_resources(flutter, args, res_dir):
@@ -254,21 +672,112 @@ def external_resources(flutter, args, res_dir):
     if not features:
         return
 
-    print(f'Build with features {list(features.keys())}')
-    if os.path.isdir(res_dir) and not os.path.islink(res_dir):
-        shutil.rmtree(res_dir)
-    elif os.path.exists(res_dir):
+    log(f'Build with features {list(features.keys())}')
+    if os.path.exists(res_dir) and (os.path.islink(res_dir) or not os.path.isdir(res_dir)):
         raise Exception(f'Find file {res_dir}, not a directory')
-    os.makedirs(res_dir, exist_ok=True)
-    download_extract_features(features, res_dir)
+    # extract into a fresh staging folder, then only touch what changed in res_dir
+    staging = os.path.join('target', 'features')
+    if os.path.isdir(staging):
+        shutil.rmtree(staging)
+    os.makedirs(staging)
+    download_extract_features(features, staging)
+    sync_tree(staging, res_dir)
+    shutil.rmtree(staging)
     if flutter:
-        os.makedirs(flutter_build_dir_2, exist_ok=True)
-        for f in pathlib.Path(res_dir).iterdir():
-            print(f'{f}')
-            if f.is_file():
-                shutil.copy2(f, flutter_build_dir_2)
-            else:
-                shutil.copytree(f, f'{flutter_build_dir_2}{f.stem}')
+        sync_tree(res_dir, flutter_build_dir_2,
+                  # folders are copied under their stem
+                  rename=lambda rel: rel if len(rel.parts) == 1
+                  else Path(rel.parts[0]).with_suffix('').joinpath(*rel.parts[1:]))
+
+
+# Incremental copies of a folder, with a manifest of the synced files kept
+# in target/sync: {destination path: {"size", "mtime_ns", "md5"}} of the
+# source files. Only changed files are replaced, and only files placed by a
+# previous sync are deleted when their source is gone, so the destination
+# can hold other files, e.g. the flutter build output.
+
+
+def sync_manifest_path(dst):
+    key = hashlib.md5(os.path.abspath(dst).encode('utf-8')).hexdigest()[:16]
+    return os.path.join('target', 'sync', f'{key}.json')
+
+
+def reflink(src, dst):
+    """Copy-on-write clone, True on success."""
+    if osx:
+        return subprocess.call(['cp', '-c', src, dst], stderr=subprocess.DEVNULL) == 0
+    if windows:
+        return False
+    import fcntl
+    FICLONE = 0x40049409
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            pass
+        else:
+            shutil.copystat(src, dst)
+            return True
+    os.remove(dst)
+    return False
+
+
+def place_file(src, dst):
+    # hardlinks are fine, sources are regenerated rather than edited in place
+    if os.path.lexists(dst):
+        os.remove(dst)
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    if not reflink(src, dst):
+        shutil.copy2(src, dst)
+
+
+def sync_tree(src, dst, rename=None):
+    """Make dst/<rename(path)> the same as src/<path> for every file of src."""
+    manifest_path = sync_manifest_path(dst)
+    try:
+        with open(manifest_path) as f:
+            old = json.load(f)
+    except (OSError, ValueError):
+        old = {}
+    new = {}
+    copied = 0
+    src_path = Path(src)
+    for file in sorted(src_path.rglob('*')):
+        if not file.is_file():
+            continue
+        rel = file.relative_to(src_path)
+        target = Path(dst, rename(rel) if rename else rel)
+        key = target.as_posix()
+        st = file.stat()
+        entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        last = old.get(key)
+        up_to_date = last is not None and target.is_file() and target.stat().st_size == st.st_size
+        if up_to_date and (last['size'], last['mtime_ns']) == (st.st_size, st.st_mtime_ns):
+            entry['md5'] = last['md5']
+        else:
+            entry['md5'] = hash_file(file)[0]
+            if not (up_to_date and last['md5'] == entry['md5']):
+                place_file(str(file), str(target))
+                copied += 1
+        new[key] = entry
+    stale = [p for p in old if p not in new]
+    for p in stale:
+        if os.path.lexists(p):
+            os.remove(p)
+        parent = os.path.dirname(p)
+        while os.path.normpath(parent) != os.path.normpath(dst) and os.path.isdir(parent) \
+                and not os.listdir(parent):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path, 'w') as f:
+        json.dump(new, f, indent=1, sort_keys=True)
+    log(f'{src} -> {dst}: {copied} updated, {len(new) - copied} unchanged, {len(stale)} removed')
 
 
 def get_features(args):
@@ -289,10 +798,7 @@ def get_features(args):
 
 
 def generate_control_file(version):
-    control_file_path = "../res/DEBIAN/control"
-    system2('/bin/rm -rf %s' % control_file_path)
-
-    content = """Package: rustdesk
+    return """Package: rustdesk
 Section: net
 Priority: optional
 Version: %s
@@ -304,9 +810,6 @@ Recommends: libayatana-appindicator3-1
 Description: A remote control software.
 
 """ % (version, get_deb_arch(), get_deb_extra_depends())
-    file = open(control_file_path, "w")
-    file.write(content)
-    file.close()
 
 
 def ffi_bindgen_function_refactor():
@@ -317,95 +820,24 @@ def ffi_bindgen_function_refactor():
 
 def build_flutter_deb(version, features):
     if not skip_cargo:
-        system2(f'cargo build --features {features} --lib --release')
         ffi_bindgen_function_refactor()
     os.chdir('flutter')
     system2('flutter build linux --release')
-    system2('mkdir -p tmpdeb/usr/bin/')
-    system2('mkdir -p tmpdeb/usr/share/rustdesk')
-    system2('mkdir -p tmpdeb/etc/rustdesk/')
-    system2('mkdir -p tmpdeb/etc/pam.d/')
-    system2('mkdir -p tmpdeb/usr/share/rustdesk/files/systemd/')
-    system2('mkdir -p tmpdeb/usr/share/icons/hicolor/256x256/apps/')
-    system2('mkdir -p tmpdeb/usr/share/icons/hicolor/scalable/apps/')
-    system2('mkdir -p tmpdeb/usr/share/applications/')
-    system2('mkdir -p tmpdeb/usr/share/polkit-1/actions')
-    system2('rm tmpdeb/usr/bin/rustdesk || true')
-    system2(
-        f'cp -r {flutter_build_dir}/* tmpdeb/usr/share/rustdesk/')
-    system2(
-        'cp ../res/rustdesk.service tmpdeb/usr/share/rustdesk/files/systemd/')
-    system2(
-        'cp ../res/128x128@2x.png tmpdeb/usr/share/icons/hicolor/256x256/apps/rustdesk.png')
-    system2(
-        'cp ../res/scalable.svg tmpdeb/usr/share/icons/hicolor/scalable/apps/rustdesk.svg')
-    system2(
-        'cp ../res/rustdesk.desktop tmpdeb/usr/share/applications/rustdesk.desktop')
-    system2(
-        'cp ../res/rustdesk-link.desktop tmpdeb/usr/share/applications/rustdesk-link.desktop')
-    system2(
-        'cp ../res/startwm.sh tmpdeb/etc/rustdesk/')
-    system2(
-        'cp ../res/xorg.conf tmpdeb/etc/rustdesk/')
-    system2(
-        'cp ../res/pam.d/rustdesk.debian tmpdeb/etc/pam.d/rustdesk')
-    system2(
-        "echo \"#!/bin/sh\" >> tmpdeb/usr/share/rustdesk/files/polkit && chmod a+x tmpdeb/usr/share/rustdesk/files/polkit")
-
-    system2('mkdir -p tmpdeb/DEBIAN')
-    generate_control_file(version)
-    system2('cp -a ../res/DEBIAN/* tmpdeb/DEBIAN/')
-    md5_file_folder("tmpdeb/")
-    system2('dpkg-deb -b tmpdeb rustdesk.deb;')
-
-    system2('/bin/rm -rf tmpdeb/')
-    system2('/bin/rm -rf ../res/DEBIAN/control')
-    os.rename('rustdesk.deb', '../rustdesk-%s.deb' % version)
-    os.chdir("..")
+    os.chdir('..')
+    file_map = flutter_deb_file_map(version, flutter_build_dir_2)
+    file_map.update({
+        'etc/rustdesk/startwm.sh': 'res/startwm.sh',
+        'etc/rustdesk/xorg.conf': 'res/xorg.conf',
+        'etc/pam.d/rustdesk': 'res/pam.d/rustdesk.debian',
+    })
+    build_deb(file_map, 'rustdesk-%s.deb' % version)
 
 
 def build_deb_from_folder(version, binary_folder):
-    os.chdir('flutter')
-    system2('mkdir -p tmpdeb/usr/bin/')
-    system2('mkdir -p tmpdeb/usr/share/rustdesk')
-    system2('mkdir -p tmpdeb/usr/share/rustdesk/files/systemd/')
-    system2('mkdir -p tmpdeb/usr/share/icons/hicolor/256x256/apps/')
-    system2('mkdir -p tmpdeb/usr/share/icons/hicolor/scalable/apps/')
-    system2('mkdir -p tmpdeb/usr/share/applications/')
-    system2('mkdir -p tmpdeb/usr/share/polkit-1/actions')
-    system2('rm tmpdeb/usr/bin/rustdesk || true')
-    system2(
-        f'cp -r ../{binary_folder}/* tmpdeb/usr/share/rustdesk/')
-    system2(
-        'cp ../res/rustdesk.service tmpdeb/usr/share/rustdesk/files/systemd/')
-    system2(
-        'cp ../res/128x128@2x.png tmpdeb/usr/share/icons/hicolor/256x256/apps/rustdesk.png')
-    system2(
-        'cp ../res/scalable.svg tmpdeb/usr/share/icons/hicolor/scalable/apps/rustdesk.svg')
-    system2(
-        'cp ../res/rustdesk.desktop tmpdeb/usr/share/applications/rustdesk.desktop')
-    system2(
-        'cp ../res/rustdesk-link.desktop tmpdeb/usr/share/applications/rustdesk-link.desktop')
-    system2(
-        "echo \"#!/bin/sh\" >> tmpdeb/usr/share/rustdesk/files/polkit && chmod a+x tmpdeb/usr/share/rustdesk/files/polkit")
-
-    system2('mkdir -p tmpdeb/DEBIAN')
-    generate_control_file(version)
-    system2('cp -a ../res/DEBIAN/* tmpdeb/DEBIAN/')
-    md5_file_folder("tmpdeb/")
-    system2('dpkg-deb -b tmpdeb rustdesk.deb;')
-
-    system2('/bin/rm -rf tmpdeb/')
-    system2('/bin/rm -rf ../res/DEBIAN/control')
-    os.rename('rustdesk.deb', '../rustdesk-%s.deb' % version)
-    os.chdir("..")
+    build_packages(version, binary_folder, ['deb'])
 
 
 def build_flutter_dmg(version, features):
-    if not skip_cargo:
-        # set minimum osx build target, now is 10.14, which is the same as the flutter xcode project
-        system2(
-            f'MACOSX_DEPLOYMENT_TARGET=10.14 cargo build --features {features} --release')
     # copy dylib
     system2(
         "cp target/release/liblibrustdesk.dylib target/release/librustdesk.dylib")
@@ -421,8 +853,6 @@ def build_flutter_dmg(version, features):
 
 
 def build_flutter_arch_manjaro(version, features):
-    if not skip_cargo:
-        system2(f'cargo build --features {features} --lib --release')
     ffi_bindgen_function_refactor()
     os.chdir('flutter')
     system2('flutter build linux --release')
@@ -431,71 +861,155 @@ def build_flutter_arch_manjaro(version, features):
     system2('HBB=`pwd`/.. FLUTTER=1 makepkg -f')
 
 
+def build_virtual_display():
+    cached_step('virtual_display',
+                lambda: system2('cargo build --release', cwd='libs/virtual_display/dylib'),
+                'cargo build --release',
+                ['Cargo.lock', 'libs/virtual_display/**/Cargo.toml',
+                 'libs/virtual_display/**/*.rs'],
+                [virtual_display_dll],
+                env=['RUSTFLAGS', 'CARGO_BUILD_TARGET'])
+
+
+def generate_inline_sciter():
+    cached_step('inline-sciter', lambda: system2('python3 res/inline-sciter.py'),
+                'python3 res/inline-sciter.py',
+                ['res/inline-sciter.py', 'res/codegen.py', 'src/ui/*.html', 'src/ui/*.css', 'src/ui/*.tis'],
+                ['src/ui/inline.rs'])
+
+
+def pack_portable(folder, exe):
+    """Run generate.py on folder, leaving the packer in target/release."""
+    cmd = f'python3 ./generate.py -f ../../{folder} -o . -e ../../{exe}'
+
+    def run():
+        os.chdir('libs/portable')
+        system2('pip3 install -r requirements.txt')
+        system2(cmd)
+        os.chdir('../..')
+    cached_step('portable', run, cmd,
+                [folder, 'libs/portable/generate.py', 'libs/portable/Cargo.toml',
+                 'libs/portable/src/*.rs'],
+                ['libs/portable/data.bin', 'libs/portable/app_metadata.toml',
+                 'target/release/rustdesk-portable-packer.exe'])
+
+
 def build_flutter_windows(version, features, skip_portable_pack):
     if not skip_cargo:
-        system2(f'cargo build --features {features} --lib --release')
         if not os.path.exists("target/release/librustdesk.dll"):
-            print("cargo build failed, please check rust source code.")
+            log("cargo build failed, please check rust source code.")
             exit(-1)
     os.chdir('flutter')
     system2('flutter build windows --release')
     os.chdir('..')
-    shutil.copy2('target/release/deps/dylib_virtual_display.dll',
-                 flutter_build_dir_2)
+    shutil.copy2(virtual_display_dll, flutter_build_dir_2)
     if skip_portable_pack:
         return
-    os.chdir('libs/portable')
-    system2('pip3 install -r requirements.txt')
-    system2(
-        f'python3 ./generate.py -f ../../{flutter_build_dir_2} -o . -e ../../{flutter_build_dir_2}/rustdesk.exe')
-    os.chdir('../..')
-    if os.path.exists('./rustdesk_portable.exe'):
-        os.replace('./target/release/rustdesk-portable-packer.exe',
-                   './rustdesk_portable.exe')
-    else:
-        os.rename('./target/release/rustdesk-portable-packer.exe',
-                  './rustdesk_portable.exe')
-    print(
+    pack_portable(flutter_build_dir_2, f'{flutter_build_dir_2}/rustdesk.exe')
+    # copied, not moved, so an unchanged package is not packed again
+    shutil.copy2('./target/release/rustdesk-portable-packer.exe',
+                 './rustdesk_portable.exe')
+    log(
         f'output location: {os.path.abspath(os.curdir)}/rustdesk_portable.exe')
     os.rename('./rustdesk_portable.exe', f'./rustdesk-{version}-install.exe')
-    print(
+    log(
         f'output location: {os.path.abspath(os.curdir)}/rustdesk-{version}-install.exe')
 
 
+def cargo_command(flutter, features):
+    """The rust build of the platform, None when it is part of the packaging
+    (cargo bundle) or skipped, --skip-cargo only applies to flutter builds."""
+    if flutter and skip_cargo:
+        return None
+    if windows or os.path.isfile('/usr/bin/pacman'):
+        if flutter:
+            return f'cargo build --features {features} --lib --release'
+        return 'cargo build --release --features ' + features
+    if os.path.isfile('/usr/bin/yum') or os.path.isfile('/usr/bin/zypper'):
+        return 'cargo build --release --features ' + features
+    if not flutter:
+        return None
+    if osx:
+        # set minimum osx build target, now is 10.14, which is the same as the flutter xcode project
+        return f'MACOSX_DEPLOYMENT_TARGET=10.14 cargo build --features {features} --release'
+    return f'cargo build --features {features} --lib --release'
+
+
 def main():
     global skip_cargo
+    global deb_sha256sums
+    global deb_compression
+    global use_build_cache
+    global explain_build_cache
+    global spans
+    global download_mirror
     parser = make_parser()
     args = parser.parse_args()
 
-    if os.path.exists(exe_path):
-        os.unlink(exe_path)
-    if os.path.isfile('/usr/bin/pacman'):
-        system2('git checkout src/ui/common.tis')
     version = get_version()
     features = ','.join(get_features(args))
     flutter = args.flutter
-    if not flutter:
-        system2('python3 res/inline-sciter.py')
     print(args.skip_cargo)
     if args.skip_cargo:
         skip_cargo = True
+    deb_sha256sums = args.sha256sums
+    deb_compression = args.deb_compression
+    use_build_cache = not args.no_build_cache
+    explain_build_cache = args.explain
+    download_mirror = args.download_mirror
+    res_dir = 'resources'
+
+    steps = []
+    if not flutter:
+        steps.append(Step('inline-sciter', generate_inline_sciter,
+                          outputs=['src/ui/inline.rs']))
+    if not args.package:
+        steps.append(Step('external-resources',
+                          lambda: external_resources(flutter, args, res_dir),
+                          outputs=[res_dir]))
+        if windows:
+            # build virtual display dynamic library
+            steps.append(Step('virtual-display', build_virtual_display,
+                              outputs=[virtual_display_dll]))
+    cargo = None if args.package else cargo_command(flutter, features)
+    if cargo:
+        # the resources and the virtual display are only needed to package
+        steps.append(Step('cargo', lambda: system2(cargo),
+                          inputs=['Cargo.toml', 'build.rs', 'src/**/*.rs'],
+                          outputs=['target/release']))
+    # the platform build changes the working directory, its inputs are the
+    # outputs of every other step, so it runs alone last
+    build_inputs = [o for s in steps for o in s.outputs]
+    steps.append(Step('build', lambda: build(args, version, features, res_dir),
+                      inputs=build_inputs))
+    if args.plan:
+        print_plan(steps)
+        return
+
+    if args.trace:
+        spans = []
+    try:
+        if os.path.exists(exe_path):
+            os.unlink(exe_path)
+        if os.path.isfile('/usr/bin/pacman'):
+            system2('git checkout src/ui/common.tis')
+        run_steps(steps, max(args.jobs, 1))
+    finally:
+        if args.trace:
+            write_trace(args.trace)
+
+
+def build(args, version, features, res_dir):
+    flutter = args.flutter
     portable = args.portable
     package = args.package
     if package:
-        build_deb_from_folder(version, package)
+        build_packages(version, package, args.formats)
         return
-    res_dir = 'resources'
-    external_resources(flutter, args, res_dir)
     if windows:
-        # build virtual display dynamic library
-        os.chdir('libs/virtual_display/dylib')
-        system2('cargo build --release')
-        os.chdir('../../..')
-
         if flutter:
             build_flutter_windows(version, features, args.skip_portable_pack)
             return
-        system2('cargo build --release --features ' + features)
         # system2('upx.exe target/release/rustdesk.exe')
         system2('mv target/release/rustdesk.exe target/release/RustDesk.exe')
         pa = os.environ.get('P')
@@ -505,13 +1019,11 @@ def main():
                 f'signtool sign /a /v /p {pa} /debug /f .\\cert.pfx /t http://timestamp.digicert.com  '
                 'target\\release\\rustdesk.exe')
         else:
-            print('Not signed')
+            log('Not signed')
         system2(
             f'cp -rf target/release/RustDesk.exe {res_dir}')
+        pack_portable(res_dir, f'{res_dir}/rustdesk-{version}-win7-install.exe')
         os.chdir('libs/portable')
-        system2('pip3 install -r requirements.txt')
-        system2(
-            f'python3 ./generate.py -f ../../{res_dir} -o . -e ../../{res_dir}/rustdesk-{version}-win7-install.exe')
         system2('mv ../../{res_dir}/rustdesk-{version}-win7-install.exe ../..')
     elif os.path.isfile('/usr/bin/pacman'):
         # pacman -S -needed base-devel
@@ -519,7 +1031,6 @@ def main():
         if flutter:
             build_flutter_arch_manjaro(version, features)
         else:
-            system2('cargo build --release --features ' + features)
             system2('git checkout src/ui/common.tis')
             system2('strip target/release/rustdesk')
             system2('ln -s res/pacman_install && ln -s res/PKGBUILD')
@@ -528,7 +1039,6 @@ def main():
             version, version))
         # pacman -U ./rustdesk.pkg.tar.zst
     elif os.path.isfile('/usr/bin/yum'):
-        system2('cargo build --release --features ' + features)
         system2('strip target/release/rustdesk')
         system2(
             "sed -i 's/Version:    .*/Version:    %s/g' res/rpm.spec" % version)
@@ -538,7 +1048,6 @@ def main():
                 version, version))
         # yum localinstall rustdesk.rpm
     elif os.path.isfile('/usr/bin/zypper'):
-        system2('cargo build --release --features ' + features)
         system2('strip target/release/rustdesk')
         system2(
             "sed -i 's/Version:    .*/Version:    %s/g' res/rpm-suse.spec" % version)
@@ -596,51 +1105,514 @@ def main():
     # verify:  spctl -a -t exec -v /Applications/RustDesk.app
     '''.format(pa, version))
                 else:
-                    print('Not signed')
+                    log('Not signed')
             else:
                 # build deb package
                 system2(
                     'mv target/release/bundle/deb/rustdesk*.deb ./rustdesk.deb')
-                system2('dpkg-deb -R rustdesk.deb tmpdeb')
-                system2('mkdir -p tmpdeb/usr/share/rustdesk/files/systemd/')
-                system2('mkdir -p tmpdeb/usr/share/icons/hicolor/256x256/apps/')
-                system2('mkdir -p tmpdeb/usr/share/icons/hicolor/scalable/apps/')
-                system2(
-                    'cp res/rustdesk.service tmpdeb/usr/share/rustdesk/files/systemd/')
-                system2(
-                    'cp res/128x128@2x.png tmpdeb/usr/share/icons/hicolor/256x256/apps/rustdesk.png')
-                system2(
-                    'cp res/scalable.svg tmpdeb/usr/share/icons/hicolor/scalable/apps/rustdesk.svg')
-                system2(
-                    'cp res/rustdesk.desktop tmpdeb/usr/share/applications/rustdesk.desktop')
-                system2(
-                    'cp res/rustdesk-link.desktop tmpdeb/usr/share/applications/rustdesk-link.desktop')
-                os.system('mkdir -p tmpdeb/etc/rustdesk/')
-                os.system('cp -a res/startwm.sh tmpdeb/etc/rustdesk/')
-                os.system('mkdir -p tmpdeb/etc/X11/rustdesk/')
-                os.system('cp res/xorg.conf tmpdeb/etc/X11/rustdesk/')
-                os.system('cp -a DEBIAN/* tmpdeb/DEBIAN/')
-                os.system('mkdir -p tmpdeb/etc/pam.d/')
-                os.system('cp pam.d/rustdesk.debian tmpdeb/etc/pam.d/rustdesk')
-                system2('strip tmpdeb/usr/bin/rustdesk')
-                system2('mkdir -p tmpdeb/usr/share/rustdesk')
-                system2('mv tmpdeb/usr/bin/rustdesk tmpdeb/usr/share/rustdesk/')
-                system2('cp libsciter-gtk.so tmpdeb/usr/share/rustdesk/')
-                md5_file_folder("tmpdeb/")
-                system2('dpkg-deb -b tmpdeb rustdesk.deb; /bin/rm -rf tmpdeb/')
-                os.rename('rustdesk.deb', 'rustdesk-%s.deb' % version)
-
-
-def md5_file(fn):
-    md5 = hashlib.md5(open('tmpdeb/' + fn, 'rb').read()).hexdigest()
-    system2('echo "%s  /%s" >> tmpdeb/DEBIAN/md5sums' % (md5, fn))
-
-def md5_file_folder(base_dir):
-    base_path = Path(base_dir)
+                file_map = read_deb('rustdesk.deb')
+                del file_map['usr/bin/rustdesk']
+                system2('strip -o target/release/rustdesk.stripped target/release/rustdesk')
+                file_map.update({
+                    'usr/share/rustdesk/rustdesk': 'target/release/rustdesk.stripped',
+                    'usr/share/rustdesk/libsciter-gtk.so': 'libsciter-gtk.so',
+                    'usr/share/rustdesk/files/systemd/rustdesk.service': 'res/rustdesk.service',
+                    'usr/share/icons/hicolor/256x256/apps/rustdesk.png': 'res/128x128@2x.png',
+                    'usr/share/icons/hicolor/scalable/apps/rustdesk.svg': 'res/scalable.svg',
+                    'usr/share/applications/rustdesk.desktop': 'res/rustdesk.desktop',
+                    'usr/share/applications/rustdesk-link.desktop': 'res/rustdesk-link.desktop',
+                    'etc/rustdesk/startwm.sh': 'res/startwm.sh',
+                    'etc/X11/rustdesk/xorg.conf': 'res/xorg.conf',
+                })
+                # optional extras, only packed when present
+                if os.path.isfile('pam.d/rustdesk.debian'):
+                    file_map['etc/pam.d/rustdesk'] = 'pam.d/rustdesk.debian'
+                if os.path.isdir('DEBIAN'):
+                    for f in os.listdir('DEBIAN'):
+                        file_map['DEBIAN/' + f] = os.path.join('DEBIAN', f)
+                os.remove('rustdesk.deb')
+                build_deb(file_map, 'rustdesk-%s.deb' % version)
+
+
+# Debian packages are assembled in-process from a file map instead of a
+# tmpdeb staging copy and dpkg-deb.
+#
+# file map: {path in package: source}, DEBIAN/ paths go to the control
+# tarball, a source is
+#   str         - a file on disk, read when the tarball is written
+#   (bytes, mode) - inline content
+#   Symlink     - a symbolic link
+#   None        - an empty directory
+#
+# The rpm, arch and tar formats (--formats) start from the same map.
+
+
+class Symlink:
+    def __init__(self, target):
+        self.target = target
+
+
+# deb architecture -> rpm and arch linux architecture
+LINUX_ARCHS = {
+    'amd64': ('x86_64', 'x86_64'),
+    'arm64': ('aarch64', 'aarch64'),
+    'armhf': ('armv7hl', 'armv7h'),
+}
+PACKAGE_FORMATS = ['deb', 'rpm', 'arch', 'tar']
+
+
+def linux_file_map(binary_folder):
+    """Files shared by every linux package format."""
+    file_map = {
+        'usr/share/icons/hicolor/256x256/apps/rustdesk.png': 'res/128x128@2x.png',
+        'usr/share/icons/hicolor/scalable/apps/rustdesk.svg': 'res/scalable.svg',
+    }
+    base_path = Path(binary_folder)
     for file in base_path.rglob('*'):
-        if file.is_file() and 'DEBIAN' not in file.parts:
-            relative_path = file.relative_to(base_path)
-            md5_file(str(relative_path))
+        if file.is_file() or file.is_symlink():
+            file_map['usr/share/rustdesk/' + file.relative_to(base_path).as_posix()] = str(file)
+    return file_map
+
+
+def parse_formats(value):
+    formats = [f.strip() for f in value.split(',') if f.strip()]
+    for f in formats:
+        if f not in PACKAGE_FORMATS:
+            raise argparse.ArgumentTypeError(f'unknown format {f}, available: {",".join(PACKAGE_FORMATS)}')
+    return formats
+
+
+def build_packages(version, binary_folder, formats):
+    """Build all formats from one binary folder, concurrently."""
+    common = linux_file_map(binary_folder)
+    # hash the binary folder once, not once per format
+    digests = hash_paths(glob.escape(s) for s in common.values() if isinstance(s, str))
+    builders = {
+        'deb': lambda m: build_deb(flutter_deb_file_map(version, binary_folder, m),
+                                   'rustdesk-%s.deb' % version, digests),
+        'rpm': lambda m: build_rpm(version, m, digests),
+        'arch': lambda m: build_arch(version, m, digests),
+        'tar': lambda m: build_tar(version, m, digests),
+    }
+    with ThreadPoolExecutor(max_workers=len(formats)) as executor:
+        futures = [executor.submit(builders[f], dict(common)) for f in formats]
+        for future in futures:
+            future.result()
+
+
+def flutter_deb_file_map(version, binary_folder, common=None):
+    file_map = common if common is not None else linux_file_map(binary_folder)
+    file_map.update({
+        # /usr/bin/rustdesk is linked by postinst
+        'usr/bin/': None,
+        'usr/share/polkit-1/actions/': None,
+        'usr/share/rustdesk/files/systemd/rustdesk.service': 'res/rustdesk.service',
+        'usr/share/applications/rustdesk.desktop': 'res/rustdesk.desktop',
+        'usr/share/applications/rustdesk-link.desktop': 'res/rustdesk-link.desktop',
+        'usr/share/rustdesk/files/polkit': (b'#!/bin/sh\n', 0o755),
+        'DEBIAN/control': (generate_control_file(version).encode('utf-8'), 0o644),
+    })
+    for f in os.listdir('res/DEBIAN'):
+        file_map['DEBIAN/' + f] = os.path.join('res/DEBIAN', f)
+    return file_map
+
+
+def files_file_map(file_map):
+    """Service and desktop files under usr/share/rustdesk/files, copied into
+    place by the rpm and pacman install scripts."""
+    file_map.update({
+        'usr/share/rustdesk/files/rustdesk.service': 'res/rustdesk.service',
+        'usr/share/rustdesk/files/rustdesk.desktop': 'res/rustdesk.desktop',
+        'usr/share/rustdesk/files/rustdesk-link.desktop': 'res/rustdesk-link.desktop',
+    })
+    return file_map
+
+
+def read_deb(path):
+    """Return the file map of an existing deb, with inline content."""
+    file_map = {}
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(b'!<arch>\n'):
+        raise Exception(f'{path} is not a deb package')
+    pos = 8
+    while pos < len(data):
+        name = data[pos:pos + 16].decode().strip().rstrip('/')
+        size = int(data[pos + 48:pos + 58].decode().strip())
+        member = data[pos + 60:pos + 60 + size]
+        pos += 60 + size + size % 2
+        if not name.startswith(('control.tar', 'data.tar')):
+            continue
+        prefix = 'DEBIAN/' if name.startswith('control.tar') else ''
+        with tarfile.open(fileobj=io.BytesIO(member), mode='r:*') as tar:
+            for info in tar:
+                arcname = os.path.normpath(info.name)
+                if arcname == '.':
+                    continue
+                if info.isdir():
+                    file_map.setdefault(prefix + arcname + '/', None)
+                elif info.isfile():
+                    file_map[prefix + arcname] = (tar.extractfile(info).read(), info.mode)
+                elif info.issym():
+                    file_map[prefix + arcname] = Symlink(info.linkname)
+                else:
+                    raise Exception(f'unsupported entry {info.name} in {path}')
+    return file_map
+
+
+def hash_file(path, sha256=False):
+    # stream in chunks, the flutter bundle has some big libraries
+    md5 = hashlib.md5()
+    sha = hashlib.sha256() if sha256 else None
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(chunk)
+            if sha:
+                sha.update(chunk)
+    return md5.hexdigest(), sha.hexdigest() if sha else None
+
+
+def hash_source(source, sha256=False):
+    if isinstance(source, Symlink):
+        return None, None
+    if isinstance(source, str):
+        if os.path.islink(source):
+            return None, None
+        return hash_file(source, sha256)
+    content = source[0]
+    return hashlib.md5(content).hexdigest(), hashlib.sha256(content).hexdigest() if sha256 else None
+
+
+def deb_checksums(data_map, sha256=False):
+    """md5sums (and sha256sums) content of the data files."""
+    files = sorted(p for p, source in data_map.items() if source is not None)
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        digests = list(executor.map(
+            lambda p: hash_source(data_map[p], sha256), files))
+    md5sums = ''.join('%s  /%s\n' % (md5, p) for p, (md5, _) in zip(files, digests) if md5)
+    sha256sums = ''.join('%s  /%s\n' % (sha, p) for p, (_, sha) in zip(files, digests) if sha)
+    return md5sums, sha256sums
+
+
+def source_date_epoch():
+    # reproducible builds, https://reproducible-builds.org/specs/source-date-epoch/
+    # defaults to the time of the last commit, the build date shown by pacman
+    if 'SOURCE_DATE_EPOCH' in os.environ:
+        return int(os.environ['SOURCE_DATE_EPOCH'])
+    try:
+        return int(subprocess.check_output(['git', 'log', '-1', '--format=%ct'],
+                                           stderr=subprocess.DEVNULL))
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return 0
+
+
+COMPRESS_THREADS = 4
+
+
+def open_compressor(out, compression):
+    """Return (writable stream, process) compressing into the file out."""
+    # xz -T1 writes the single threaded format and the block size follows the
+    # level, pin both so the bytes do not depend on the cores of the machine
+    tool = {
+        'xz': ['xz', f'-T{COMPRESS_THREADS}', '--block-size=8MiB', '-c'],
+        'zstd': ['zstd', f'-T{COMPRESS_THREADS}', '-19', '-c', '-q'],
+        'gzip': ['gzip', '-9', '-n', '-c'],
+    }[compression]
+    if shutil.which(tool[0]):
+        proc = subprocess.Popen(tool, stdin=subprocess.PIPE, stdout=out)
+        return proc.stdin, proc
+    if compression == 'xz':
+        import lzma
+        return lzma.LZMAFile(out, 'w'), None
+    if compression == 'gzip':
+        import gzip
+        return gzip.GzipFile(fileobj=out, mode='w', mtime=0), None
+    raise Exception(f'{compression} not found, needed by --deb-compression')
+
+
+def tarball_paths(file_map):
+    """The paths of the file map with their parent directories, in archive
+    order."""
+    paths = set()
+    for p in file_map:
+        paths.add(p)
+        parent = os.path.dirname(p.rstrip('/'))
+        while parent:
+            paths.add(parent + '/')
+            parent = os.path.dirname(parent)
+    return sorted(paths, key=lambda p: p.rstrip('/'))
+
+
+def write_tarball(file_map, out, compression, prefix='./'):
+    """Stream the file map into a compressed tarball written to out."""
+    mtime = source_date_epoch()
+    stream, proc = open_compressor(out, compression)
+    with tarfile.open(fileobj=stream, mode='w|', format=tarfile.GNU_FORMAT) as tar:
+        if prefix:
+            tar.addfile(deb_tarinfo(tarfile.TarInfo(prefix), tarfile.DIRTYPE, 0o755, mtime))
+        for p in tarball_paths(file_map):
+            source = file_map.get(p)
+            if p.endswith('/'):
+                info = deb_tarinfo(tarfile.TarInfo(prefix + p), tarfile.DIRTYPE, 0o755, mtime)
+                tar.addfile(info)
+            elif isinstance(source, Symlink):
+                info = tarfile.TarInfo(prefix + p)
+                info.linkname = source.target
+                tar.addfile(deb_tarinfo(info, tarfile.SYMTYPE, 0o777, mtime))
+            elif isinstance(source, str):
+                info = tar.gettarinfo(source, arcname=prefix + p)
+                mode = 0o755 if info.mode & 0o111 else 0o644
+                deb_tarinfo(info, info.type, mode, mtime)
+                if info.isreg():
+                    with open(source, 'rb') as f:
+                        tar.addfile(info, f)
+                else:
+                    tar.addfile(info)
+            else:
+                (content, mode) = source
+                info = tarfile.TarInfo(prefix + p)
+                info.size = len(content)
+                tar.addfile(deb_tarinfo(info, tarfile.REGTYPE, mode & 0o7777, mtime),
+                            io.BytesIO(content))
+    stream.close()
+    if proc and proc.wait() != 0:
+        raise Exception(f'{compression} failed')
+
+
+def deb_tarinfo(info, type, mode, mtime):
+    info.type = type
+    info.mode = mode
+    info.mtime = mtime
+    info.uid = info.gid = 0
+    info.uname = info.gname = 'root'
+    return info
+
+
+def write_ar_member(f, name, size, mtime):
+    f.write(('%-16s%-12d%-6d%-6d%-8o%-10d`\n' % (name, mtime, 0, 0, 0o100644, size)).encode())
+
+
+def package_step(kind, file_map, output, write, options='', digests=None):
+    """Run write() through the build cache, keyed by the map layout.
+
+    digests are the {file: md5} of sources hashed already, the other
+    sources are hashed here.
+    """
+    digests = digests or {}
+    sources = sorted(set(s for s in file_map.values() if isinstance(s, str)))
+    inputs = hash_paths(glob.escape(s) for s in sources if s not in digests)
+    inputs.update((s, digests[s]) for s in sources if s in digests)
+    layout = hashlib.md5()
+    for (p, source) in sorted(file_map.items()):
+        layout.update(p.encode() + b'\0')
+        if isinstance(source, Symlink):
+            layout.update(b'-> ' + source.target.encode())
+        elif isinstance(source, str):
+            layout.update(source.encode())
+        elif source is not None:
+            layout.update(hashlib.md5(source[0]).digest() + b'%o' % source[1])
+        layout.update(b'\0')
+    cmd = f'build_{kind} {output} {layout.hexdigest()} {source_date_epoch()} {options}'.rstrip()
+    cached_step(f'{kind} {output}', write, cmd, inputs, [glob.escape(output)])
+
+
+def build_deb(file_map, output, digests=None):
+    package_step('deb', file_map, output, lambda: write_deb(file_map, output),
+                 f'{deb_compression} sha256sums={deb_sha256sums}', digests)
+
+
+def write_deb(file_map, output):
+    control_map = {p[len('DEBIAN/'):]: s for p, s in file_map.items() if p.startswith('DEBIAN/')}
+    data_map = {p: s for p, s in file_map.items() if not p.startswith('DEBIAN/')}
+    md5sums, sha256sums = deb_checksums(data_map, deb_sha256sums)
+    control_map['md5sums'] = (md5sums.encode(), 0o644)
+    if deb_sha256sums:
+        control_map['sha256sums'] = (sha256sums.encode(), 0o644)
+    ext = {'xz': 'xz', 'zstd': 'zst', 'gzip': 'gz'}[deb_compression]
+    mtime = source_date_epoch()
+    with tempfile.TemporaryFile() as control, tempfile.TemporaryFile() as data:
+        # control files are tiny, always xz for the widest dpkg support
+        write_tarball(control_map, control, 'xz')
+        write_tarball(data_map, data, deb_compression)
+        with open(output, 'wb') as f:
+            f.write(b'!<arch>\n')
+            write_ar_member(f, 'debian-binary', 4, mtime)
+            f.write(b'2.0\n')
+            for (name, member) in (('control.tar.xz', control), ('data.tar.' + ext, data)):
+                size = member.seek(0, os.SEEK_END)
+                member.seek(0)
+                write_ar_member(f, name, size, mtime)
+                shutil.copyfileobj(member, f)
+                if size % 2:
+                    f.write(b'\n')
+    log(f'output location: {os.path.abspath(output)}')
+
+
+def build_tar(version, file_map, digests=None):
+    output = f'rustdesk-{version}.tar.gz'
+    files_file_map(file_map)
+
+    def write():
+        with open(output, 'wb') as f:
+            write_tarball(file_map, f, 'gzip')
+        log(f'output location: {os.path.abspath(output)}')
+    package_step('tar', file_map, output, write, digests=digests)
+
+
+def read_pkgbuild_array(text, name):
+    m = re.search(r'^%s=\((.*?)\)' % name, text, re.M)
+    return re.findall(r"'([^']*)'", m.group(1)) if m else []
+
+
+def build_arch(version, file_map, digests=None):
+    with open('res/PKGBUILD') as f:
+        pkgbuild = f.read()
+    pkgrel = re.search(r'^pkgrel=(\S*)', pkgbuild, re.M).group(1)
+    arch = LINUX_ARCHS[get_deb_arch()][1]
+    files_file_map(file_map)
+    file_map['usr/bin/rustdesk'] = Symlink('/usr/share/rustdesk/rustdesk')
+    size = sum(os.path.getsize(s) if isinstance(s, str) else len(s[0])
+               for p, s in file_map.items() if s is not None and not isinstance(s, Symlink))
+    file_map['.INSTALL'] = 'res/pacman_install'
+    pkginfo = [
+        'pkgname = rustdesk',
+        'pkgbase = rustdesk',
+        f'pkgver = {version}-{pkgrel}',
+        'pkgdesc = A remote control software.',
+        'url = https://rustdesk.com',
+        f'builddate = {source_date_epoch()}',
+        'packager = rustdesk <info@rustdesk.com>',
+        f'size = {size}',
+        f'arch = {arch}',
+    ]
+    pkginfo += [f'license = {x}' for x in read_pkgbuild_array(pkgbuild, 'license')]
+    pkginfo += [f'depend = {x}' for x in read_pkgbuild_array(pkgbuild, 'depends')]
+    file_map['.PKGINFO'] = (('\n'.join(pkginfo) + '\n').encode('utf-8'), 0o644)
+    compression = 'zstd' if shutil.which('zstd') else 'xz'
+    output = f'rustdesk-{version}-manjaro-arch.pkg.tar.' + {'zstd': 'zst', 'xz': 'xz'}[compression]
+
+    def write():
+        file_map['.MTREE'] = (arch_mtree(file_map), 0o644)
+        with open(output, 'wb') as f:
+            # pacman expects .PKGINFO at the root, not under ./
+            write_tarball(file_map, f, compression, prefix='')
+        log(f'output location: {os.path.abspath(output)}')
+    package_step('arch', file_map, output, write, digests=digests)
+
+
+def mtree_escape(path):
+    return ''.join(chr(c) if 0x20 < c < 0x7f and c not in b'#=\\' else '\\%03o' % c
+                   for c in path.encode('utf-8'))
+
+
+def arch_mtree(file_map):
+    """.MTREE of the package as makepkg writes it with bsdtar, read by
+    `pacman -Qkk` to check the installed files."""
+    mtime = source_date_epoch()
+    paths = tarball_paths(file_map)
+    files = [p for p in paths if isinstance(file_map.get(p), (str, tuple))]
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        digests = dict(zip(files, executor.map(
+            lambda p: hash_source(file_map[p], True), files)))
+    lines = ['#mtree', '/set type=file uid=0 gid=0 mode=644']
+    for p in paths:
+        source = file_map.get(p)
+        entry = f'./{mtree_escape(p.rstrip("/"))} time={mtime}.0'
+        if isinstance(source, str) and os.path.islink(source):
+            source = Symlink(os.readlink(source))
+        if p.endswith('/'):
+            entry += ' mode=755 type=dir'
+        elif isinstance(source, Symlink):
+            entry += f' mode=777 type=link link={mtree_escape(source.target)}'
+        else:
+            if isinstance(source, str):
+                size = os.path.getsize(source)
+                mode = 0o755 if os.stat(source).st_mode & 0o111 else 0o644
+            else:
+                size = len(source[0])
+                mode = source[1] & 0o7777
+            (md5, sha256) = digests[p]
+            if mode != 0o644:
+                entry += ' mode=%o' % mode
+            entry += f' size={size} md5digest={md5} sha256digest={sha256}'
+        lines.append(entry)
+    import gzip
+    return gzip.compress(('\n'.join(lines) + '\n').encode('utf-8'), mtime=0)
+
+
+def rpm_escape(path):
+    # %files entries are macro expanded then globbed
+    return re.sub(r'([\\*?\[\]{}])', r'\\\1', path).replace('%', '%%')
+
+
+def rpm_spec(version, file_map, stage):
+    """res/rpm-flutter.spec with the install and files sections generated
+    from the file map."""
+    sections = [['']]
+    with open('res/rpm-flutter.spec') as f:
+        for line in f:
+            if re.match(r'%(description|prep|build|install|files|changelog|pre|post|preun|postun)\b',
+                        line):
+                sections.append([line.split()[0]])
+            sections[-1].append(line)
+    spec = []
+    for section in sections:
+        (name, lines) = (section[0], section[1:])
+        if name == '':
+            lines = [f'Version:    {version}\n' if l.startswith('Version:') else l for l in lines]
+        elif name == '%install':
+            lines = ['%install\n', f'cp -a "{stage}/." "%{{buildroot}}/"\n', '\n']
+        elif name == '%files':
+            # own the directories of the bundle too, so they go on uninstall
+            lines = ['%files\n'] + [
+                f'%dir "/{rpm_escape(p.rstrip("/"))}"\n' if p.endswith('/') else f'"/{rpm_escape(p)}"\n'
+                for p in tarball_paths(file_map)
+                if p.startswith('usr/share/rustdesk/') or not p.endswith('/')] + ['\n']
+        spec += lines
+    return ''.join(spec)
+
+
+def stage_file_map(file_map, folder):
+    """Materialize the file map in folder, hardlinking files when possible."""
+    for (p, source) in file_map.items():
+        target = os.path.join(folder, p)
+        if source is None:
+            os.makedirs(target, exist_ok=True)
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if isinstance(source, Symlink):
+            os.symlink(source.target, target)
+        elif isinstance(source, str):
+            place_file(source, target)
+        else:
+            (content, mode) = source
+            with open(target, 'wb') as f:
+                f.write(content)
+            os.chmod(target, mode)
+
+
+def build_rpm(version, file_map, digests=None):
+    files_file_map(file_map)
+    arch = LINUX_ARCHS[get_deb_arch()][0]
+    output = f'rustdesk-{version}-fedora28-centos8.rpm'
+
+    def write():
+        # rpmbuild has no file list input, build it from a staged tree
+        os.makedirs('target', exist_ok=True)
+        work = os.path.abspath(tempfile.mkdtemp(prefix='rpm-', dir='target'))
+        try:
+            stage = os.path.join(work, 'stage')
+            stage_file_map(file_map, stage)
+            spec = os.path.join(work, 'rustdesk.spec')
+            with open(spec, 'w') as f:
+                f.write(rpm_spec(version, file_map, stage))
+            system2(f'rpmbuild -bb --target {arch} --define "_topdir {work}/rpmbuild" '
+                    f'--define "_rpmdir {work}" --define "_build_name_fmt rustdesk.rpm" "{spec}"')
+            shutil.move(os.path.join(work, 'rustdesk.rpm'), output)
+        finally:
+            shutil.rmtree(work)
+        log(f'output location: {os.path.abspath(output)}')
+    package_step('rpm', file_map, output, write, arch, digests)
 
 
 if __name__ == "__main__":
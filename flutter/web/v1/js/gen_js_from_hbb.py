@@ -3,25 +3,27 @@
 import re
 import os
 import glob
+import json
+import hashlib
 from tabnanny import check
 
-def pad_start(s, n, c = ' '):
-   if len(s) >= n:
-      return s
-   return c * (n - len(s)) + s
+# served at the root by vite dev and copied next to the bundle by vite build
+LANG_DIR = 'public/lang'
+RUST_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', '0': '\0', '\\': '\\', '"': '"', "'": "'"}
 
-def safe_unicode(s):
-   res = ""
-   for c in s:
-      res += r"\u{}".format(pad_start(hex(ord(c))[2:], 4, '0'))
-   return res
+def unescape(s):
+   return re.sub(r'\\(u\{([0-9a-fA-F]+)\}|.)',
+                 lambda m: chr(int(m.group(2), 16)) if m.group(2) else RUST_ESCAPES[m.group(1)], s)
 
-def main():
-   print('export const LANGS = {')
-   for fn in glob.glob('../../../src/lang/*'):
+def write_langs():
+   """Write one compact json file per language, named by its content hash so
+   it can be cached forever, and return the {lang: file name} index."""
+   os.makedirs(LANG_DIR, exist_ok=True)
+   files = {}
+   for fn in sorted(glob.glob('../../../src/lang/*.rs')):
       lang = os.path.basename(fn)[:-3]
       if lang == 'template': continue
-      print('  %s: {'%lang)
+      dict = {}
       for ln in open(fn, encoding='utf-8'):
          ln = ln.strip()
          if ln.startswith('("'):
@@ -29,8 +31,24 @@ def main():
             assert(len(toks) == 2)
             a = toks[0][2:]
             b = toks[1][:-3]
-            print('    "%s": "%s",'%(safe_unicode(a), safe_unicode(b)))
-      print('  },')
+            dict[unescape(a)] = unescape(b)
+      # only quotes, backslashes and control characters are escaped
+      data = json.dumps(dict, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+      name = '%s.%s.json'%(lang, hashlib.sha256(data).hexdigest()[:8])
+      path = os.path.join(LANG_DIR, name)
+      if not os.path.exists(path):
+         with open(path, 'wb') as f:
+            f.write(data)
+      files[lang] = name
+   for name in os.listdir(LANG_DIR):
+      if name not in files.values():
+         os.remove(os.path.join(LANG_DIR, name))
+   return files
+
+def main():
+   print('export const LANG_FILES: { [lang: string]: string } = {')
+   for (lang, name) in write_langs().items():
+      print('  "%s": "%s",'%(lang, name))
    print('}')
    check_if_retry = ['', False]
    KEY_MAP = ['', False]
@@ -1,6 +1,6 @@
 import * as zstd from "zstddec";
 import { KeyEvent, controlKeyFromJSON, ControlKey } from "./message";
-import { KEY_MAP, LANGS } from "./gen_js_from_hbb";
+import { KEY_MAP, LANG_FILES } from "./gen_js_from_hbb";
 
 let decompressor: zstd.ZSTDDecoder;
 
@@ -33,11 +33,52 @@ export async function decompress(compressedArray: Uint8Array) {
 }
 
 const LANG = getLang();
+// languages loaded so far, each one is fetched on first use
+const LANGS: { [lang: string]: any } = {};
+const loading: { [lang: string]: Promise<void> } = {};
+// a failed load is kept this long before the next try, not retried by every
+// translate() while offline
+const LANG_RETRY_MS = 60000;
+
+function langOf(locale: string) {
+  return LANG || locale.substring(locale.length - 2).toLowerCase();
+}
+
+function langUrl(file: string) {
+  // public/lang is served at the root by vite dev, and copied next to the
+  // bundle by vite build
+  if (import.meta.env.DEV) return "/lang/" + file;
+  return new URL("lang/" + file, import.meta.url).href;
+}
+
+export function loadLang(lang: string): Promise<void> {
+  if (!LANG_FILES[lang]) lang = "en";
+  if (!loading[lang]) {
+    loading[lang] = fetch(langUrl(LANG_FILES[lang]))
+      .then((res) => res.json())
+      .then((dict) => {
+        LANGS[lang] = dict;
+      })
+      .catch((e) => {
+        // translate() falls back to english meanwhile
+        console.error("load " + lang + " failed: " + e);
+        setTimeout(() => delete loading[lang], LANG_RETRY_MS);
+      });
+  }
+  return loading[lang];
+}
+
+export async function initLang(locale: string) {
+  await Promise.all([loadLang("en"), loadLang(langOf(locale))]);
+}
 
 export function translate(locale: string, text: string): string {
-  const lang = LANG || locale.substring(locale.length - 2).toLowerCase();
-  let en = LANGS.en as any;
-  let dict = (LANGS as any)[lang];
+  const lang = langOf(locale);
+  // english or the text itself until the language is loaded
+  if (!LANGS[lang]) loadLang(lang);
+  if (!LANGS.en) loadLang("en");
+  let en = LANGS.en || {};
+  let dict = LANGS[lang];
   if (!dict) dict = en;
   let res = dict[text];
   if (!res && lang != "en") res = en[text];
@@ -3,7 +3,7 @@ import _sodium from "libsodium-wrappers";
 import { CursorData } from "./message";
 import { loadVp9 } from "./codec";
 import { checkIfRetry, version } from "./gen_js_from_hbb";
-import { initZstd, translate } from "./common";
+import { initLang, initZstd, translate } from "./common";
 import PCMPlayer from "pcm-player";
 
 window.curConn = undefined;
@@ -337,7 +337,7 @@ window.init = async () => {
     pcmPlayer.feed(e.data);
   }
   loadVp9(() => { });
-  await initZstd();
+  await Promise.all([initZstd(), initLang(navigator.language)]);
   console.log('init done');
 }
 
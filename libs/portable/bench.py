@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+# Benchmark generate.py on synthetic bundles shaped like the flutter windows
+# output: a few big dlls and many small assets.
+#
+# python3 bench.py                       # all trees, levels 1 5 9 11
+# python3 bench.py -t small -l 11 --solid -o bench.json
+
+import os
+import io
+import json
+import optparse
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from multiprocessing import Pool
+
+import brotli
+
+import generate
+
+try:
+    import resource
+except ImportError:
+    # windows
+    resource = None
+
+MB = 1024 * 1024
+
+# scale of the default shape below
+TREES = {
+    'small': 1,
+    'medium': 4,
+    'large': 16,
+}
+# (path, size in MB at scale 1)
+BIG_FILES = [
+    ('librustdesk.dll', 6),
+    ('flutter_windows.dll', 4),
+    ('rustdesk.exe', 0.25),
+    ('data/app.so', 2),
+    ('data/icudtl.dat', 0.75),
+]
+# (directory, extension, count at scale 1, max size in KB)
+SMALL_FILES = [
+    ('data/flutter_assets/assets', '.json', 120, 16),
+    ('data/flutter_assets/assets', '.svg', 80, 8),
+    ('data/flutter_assets/assets', '.png', 60, 64),
+    ('data/flutter_assets/fonts', '.ttf', 6, 256),
+    ('data/flutter_assets/shaders', '.frag', 10, 16),
+    ('', '.dll', 8, 512),
+]
+
+
+def binary_content(rnd: random.Random, size: int) -> bytes:
+    """Roughly as compressible as real code: repeated slices of a small
+    instruction pool mixed with random data."""
+    pool = rnd.randbytes(64 * 1024)
+    buf = bytearray()
+    while len(buf) < size:
+        if rnd.random() < 0.3:
+            buf += rnd.randbytes(rnd.randint(16, 256))
+        else:
+            start = rnd.randint(0, len(pool) - 256)
+            buf += pool[start:start + rnd.randint(8, 256)]
+    return bytes(buf[:size])
+
+
+def text_content(rnd: random.Random, size: int) -> bytes:
+    words = ['remote', 'desktop', 'id', 'password', 'connect', 'peer', 'relay',
+             'file', 'transfer', 'display', 'audio', 'clipboard', 'true', 'false']
+    buf = io.StringIO()
+    while buf.tell() < size:
+        buf.write(f'"{rnd.choice(words)}_{rnd.randint(0, 999)}": '
+                  f'"{" ".join(rnd.choices(words, k=rnd.randint(1, 6)))}",\n')
+    return buf.getvalue().encode()[:size]
+
+
+def make_tree(folder: str, scale: int, seed: int = 0) -> int:
+    """Create a synthetic bundle in folder, return its size in bytes."""
+    rnd = random.Random(seed)
+    total = 0
+    for (path, size) in BIG_FILES:
+        content = binary_content(rnd, int(size * scale * MB))
+        total += write_file(os.path.join(folder, path), content)
+    for (directory, ext, count, max_kb) in SMALL_FILES:
+        for i in range(count * scale):
+            size = rnd.randint(256, max_kb * 1024)
+            if ext == '.png':
+                content = b'\x89PNG\r\n\x1a\n' + rnd.randbytes(size)
+            elif ext in ('.dll', '.ttf'):
+                content = binary_content(rnd, size)
+            else:
+                content = text_content(rnd, size)
+            total += write_file(os.path.join(folder, directory, f'{i}{ext}'), content)
+    return total
+
+
+def write_file(path: str, content: bytes) -> int:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return len(content)
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macos, KB elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def bench_hash(folder: str, size: int) -> dict:
+    res = {}
+    for (digest, name) in generate.DIGEST_NAMES.items():
+        start = time.perf_counter()
+        for root, _, files in os.walk(folder):
+            for f in files:
+                with open(os.path.join(root, f), 'rb') as fh:
+                    generate.hex_digest(fh.read(), digest)
+        seconds = time.perf_counter() - start
+        res[name] = {'seconds': round(seconds, 3), 'mb_s': round(size / MB / seconds, 1)}
+    return res
+
+
+def bench_pack(args) -> dict:
+    """One packing run, executed in a fresh process so the peak RSS is its own."""
+    (folder, size, level, solid, digest) = args
+    output_folder = tempfile.mkdtemp(prefix='rustdesk-bench-out-')
+    try:
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            table = generate.generate_md5_table(
+                folder, level, solid=solid, digest=digest)
+            compress_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            generate.write_package_metadata(
+                table, output_folder, './rustdesk.exe', digest=digest)
+            write_seconds = time.perf_counter() - start
+        data_bin_size = os.path.getsize(os.path.join(output_folder, 'data.bin'))
+    finally:
+        shutil.rmtree(output_folder)
+    return {
+        'level': level,
+        'solid': solid,
+        'compress_seconds': round(compress_seconds, 3),
+        'write_seconds': round(write_seconds, 3),
+        'mb_s': round(size / MB / (compress_seconds + write_seconds), 2),
+        'ratio': round(data_bin_size / size, 4),
+        'data_bin_size': data_bin_size,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("-t", "--tree", dest="trees", action="append", choices=list(TREES),
+                      help=f"synthetic tree to bench, repeatable, default is all of {list(TREES)}")
+    parser.add_option("-l", "--level", dest="levels", action="append", type="int",
+                      help="compression level, repeatable, default is 1 5 9 11")
+    parser.add_option("--solid", dest="solid", action="store_true", default=False,
+                      help="also bench solid mode")
+    parser.add_option("--digest", dest="digest", choices=list(generate.DIGEST_NAMES.values()),
+                      default=generate.DIGEST_NAMES[generate.DIGEST_BLAKE2B],
+                      help="digest used by the packing runs, default is blake2b")
+    parser.add_option("-o", "--output", dest="output",
+                      help="write the json report to this file instead of stdout")
+    (options, _) = parser.parse_args()
+    trees = options.trees or list(TREES)
+    levels = options.levels or [1, 5, 9, 11]
+    modes = [False, True] if options.solid else [False]
+    digest = next(k for k, v in generate.DIGEST_NAMES.items() if v == options.digest)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'brotli': getattr(brotli, '__version__', None),
+        'digest': options.digest,
+        'trees': [],
+    }
+    for tree in trees:
+        folder = tempfile.mkdtemp(prefix=f'rustdesk-bench-{tree}-')
+        try:
+            size = make_tree(folder, TREES[tree])
+            files = sum(len(f) for _, _, f in os.walk(folder))
+            print(f"{tree}: {files} files, {size / MB:.1f}MB", file=sys.stderr)
+            result = {
+                'tree': tree,
+                'files': files,
+                'bytes': size,
+                'hash': bench_hash(folder, size),
+                'runs': [],
+            }
+            for level in levels:
+                for solid in modes:
+                    with Pool(1) as pool:
+                        run = pool.apply(bench_pack, ((folder, size, level, solid, digest),))
+                    print(f"  level {level}{' solid' if solid else ''}: "
+                          f"{run['mb_s']}MB/s, ratio {run['ratio']}", file=sys.stderr)
+                    result['runs'].append(run)
+            report['trees'].append(result)
+        finally:
+            shutil.rmtree(folder)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,82 +1,597 @@
 #!/usr/bin/env python3
 
 import os
+import json
+import mmap
 import optparse
-from hashlib import md5
+from functools import partial
+from hashlib import blake2b, md5
 import brotli
 import datetime
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # 4GB maximum
 length_count = 4
+# hex digest, md5 or 128 bits blake2b
+digest_length = 32
 # encoding
 encoding = 'utf-8'
 
-# output: {path: (compressed_data, file_md5)}
+# per-entry storage method, must match bin_reader.rs
+METHOD_STORED = 0
+METHOD_BROTLI = 1
+# a brotli compressed group of small files, see pack_solid_segment()
+METHOD_SOLID = 2
+# empty entry ending the hot set, everything before it is needed at startup
+METHOD_HOT_END = 3
+# tombstone of a delta package, the launcher deletes the path
+METHOD_DELETED = 4
 
+# digest algorithm in the header, must match bin_reader.rs
+DIGEST_MD5 = 0
+DIGEST_BLAKE2B = 1
+DIGEST_NAMES = {DIGEST_MD5: 'md5', DIGEST_BLAKE2B: 'blake2b'}
 
-def generate_md5_table(folder: str, level) -> dict:
+# Already compressed formats, brotli gains nothing on them.
+STORED_EXTENSIONS = {
+    '.png', '.jpg', '.jpeg', '.gif', '.webp',
+    '.woff', '.woff2',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.zst', '.br',
+    '.pak',
+    '.mp3', '.mp4', '.ogg',
+}
+# Files are probed with a fast compression of their head first.
+SAMPLE_SIZE = 64 * 1024
+SAMPLE_QUALITY = 1
+# The sample must shrink by at least this ratio, or the file is stored.
+SAMPLE_MIN_GAIN = 0.02
+# Files above this size are compressed with --large-level.
+LARGE_FILE_SIZE = 8 * 1024 * 1024
+# Solid mode: compressible files below this size are grouped into segments
+# of about SOLID_SEGMENT_SIZE bytes before compression.
+SOLID_FILE_SIZE = 256 * 1024
+SOLID_SEGMENT_SIZE = 4 * 1024 * 1024
+
+
+def hex_digest(data, digest: int) -> bytes:
+    if digest == DIGEST_BLAKE2B:
+        generator = blake2b(digest_size=digest_length // 2)
+    else:
+        generator = md5()
+    generator.update(data)
+    return generator.hexdigest().encode(encoding=encoding)
+
+
+def chunk_digests(content, digest: int, chunk_size: int) -> list:
+    """Digests of each chunk_size piece, only for files spanning several chunks."""
+    if len(content) <= chunk_size:
+        return []
+    view = memoryview(content)
+    return [hex_digest(view[i:i + chunk_size], digest)
+            for i in range(0, len(content), chunk_size)]
+
+
+def choose_compression(path: str, content: bytes, level: int, large_level: int):
+    """Return (method, quality) for a file, quality is None for stored."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in STORED_EXTENSIONS or not content:
+        return METHOD_STORED, None
+    sample = content[:SAMPLE_SIZE]
+    sample_compressed = brotli.compress(sample, quality=SAMPLE_QUALITY)
+    if len(sample_compressed) > len(sample) * (1 - SAMPLE_MIN_GAIN):
+        return METHOD_STORED, None
+    if len(content) > LARGE_FILE_SIZE:
+        return METHOD_BROTLI, large_level
+    return METHOD_BROTLI, level
+
+
+def compress_content(path: str, content: bytes, level: int, large_level: int):
+    method, quality = choose_compression(path, content, level, large_level)
+    if method == METHOD_BROTLI:
+        content_compressed = brotli.compress(content, quality=quality)
+        # never let an entry grow
+        if len(content_compressed) < len(content):
+            return method, content_compressed
+    return METHOD_STORED, content
+
+
+def pack_solid_segment(members: list) -> bytes:
+    """Concatenate [(path, content, digest)] into an uncompressed segment.
+
+    Members use the entry layout without the method byte, they are always
+    stored inside the segment.
+    """
+    buf = bytearray()
+    for (path, content, digest) in members:
+        path = path.encode(encoding=encoding)
+        buf += len(path).to_bytes(length=length_count, byteorder='big')
+        buf += path
+        buf += len(content).to_bytes(length=length_count, byteorder='big')
+        buf += content
+        buf += digest
+    return bytes(buf)
+
+
+def unpack_solid_segment(segment: bytes) -> list:
+    members = []
+    pos = 0
+    while pos < len(segment):
+        path_length = int.from_bytes(
+            segment[pos:pos + length_count], byteorder='big')
+        pos += length_count
+        path = bytes(segment[pos:pos + path_length]).decode(encoding=encoding)
+        pos += path_length
+        data_length = int.from_bytes(
+            segment[pos:pos + length_count], byteorder='big')
+        pos += length_count
+        content = segment[pos:pos + data_length]
+        pos += data_length
+        members.append((path, content, segment[pos:pos + digest_length]))
+        pos += digest_length
+    return members
+
+
+def generate_solid_segments(small_files: list, level: int, digest: int, hot=False) -> dict:
+    """Hot segments are named HOT_SEGMENT..., they go with the hot set."""
     res: dict = dict()
-    curdir = os.curdir
+    # similar files next to each other compress better
+    small_files.sort(key=lambda m: (os.path.splitext(m[0])[1].lower(), m[0]))
+    members = []
+    size = 0
+    for member in small_files + [None]:
+        if member is not None:
+            members.append(member)
+            size += len(member[1])
+        if members and (member is None or size >= SOLID_SEGMENT_SIZE):
+            segment = pack_solid_segment(members)
+            name = f"{HOT_SEGMENT if hot else '<solid'} {len(res)}>"
+            print(f"Processing {name}, {len(members)} files...")
+            res[name] = (METHOD_SOLID, brotli.compress(segment, quality=level),
+                         hex_digest(segment, digest), None)
+            members = []
+            size = 0
+    return res
+
+# name prefix of the solid segments made of hot set files
+HOT_SEGMENT = '<hot solid'
+
+# Loaded by the flutter runner at startup besides the import table,
+# a trailing / includes the whole directory.
+FLUTTER_HOT_SET = [
+    'flutter_windows.dll',
+    'librustdesk.dll',
+    'data/icudtl.dat',
+    'data/app.so',
+    'data/flutter_assets/',
+]
+
+
+def pe_imports(data: bytes) -> list:
+    """Return the dll names in the import table of a PE file, [] if not PE."""
+    try:
+        if data[:2] != b'MZ':
+            return []
+        pe = struct.unpack_from('<I', data, 0x3c)[0]
+        if data[pe:pe + 4] != b'PE\0\0':
+            return []
+        sections, optional_size = struct.unpack_from('<xxHxxxxxxxxxxxxH', data, pe + 4)
+        optional = pe + 24
+        magic = struct.unpack_from('<H', data, optional)[0]
+        # data directories start after the PE32 / PE32+ specific fields
+        directories = optional + (96 if magic == 0x10b else 112)
+        import_rva = struct.unpack_from('<I', data, directories + 8)[0]
+        if import_rva == 0:
+            return []
+        section_table = optional + optional_size
+        ranges = []
+        for i in range(sections):
+            (virtual_size, virtual_address, raw_size, raw_pointer) = struct.unpack_from(
+                '<IIII', data, section_table + i * 40 + 8)
+            ranges.append((virtual_address, max(virtual_size, raw_size), raw_pointer))
+
+        def rva_to_offset(rva):
+            for (va, size, raw) in ranges:
+                if va <= rva < va + size:
+                    return rva - va + raw
+            raise ValueError(f"rva {rva:#x} out of sections")
+
+        res = []
+        descriptor = rva_to_offset(import_rva)
+        while True:
+            name_rva = struct.unpack_from('<I', data, descriptor + 12)[0]
+            if name_rva == 0:
+                break
+            name = rva_to_offset(name_rva)
+            res.append(data[name:data.index(b'\0', name)].decode('ascii'))
+            descriptor += 20
+        return res
+    except (struct.error, ValueError, UnicodeDecodeError):
+        return []
+
+
+def derive_hot_set(folder: str, exe: str) -> list:
+    """The executable, the dlls it loads from the folder (recursively) and
+    the flutter engine files."""
+    local_dlls = {f.lower(): f for f in os.listdir(folder)}
+    hot_set = [exe] + [p for p in FLUTTER_HOT_SET
+                       if os.path.exists(os.path.join(folder, p))]
+    pending = [exe] + [p for p in hot_set if p.lower().endswith('.dll')]
+    while pending:
+        with open(os.path.join(folder, pending.pop()), 'rb') as f:
+            imports = pe_imports(f.read())
+        for dll in imports:
+            dll = local_dlls.get(dll.lower())
+            if dll and dll not in hot_set:
+                hot_set.append(dll)
+                pending.append(dll)
+    return hot_set
+
+
+def read_hot_set(manifest: str) -> list:
+    """One path relative to --folder per line, # starts a comment."""
+    with open(manifest, encoding=encoding) as f:
+        lines = [line.split('#')[0].strip() for line in f]
+    return [line for line in lines if line]
+
+
+def normalize_hot_set(hot_set: list) -> list:
+    """Convert hot set paths to md5 table keys like ./dir/file."""
+    res = []
+    for p in hot_set:
+        directory = p.endswith('/')
+        p = '.' + os.sep + os.path.normpath(p.replace('/', os.sep)).lstrip(os.sep)
+        res.append(p + os.sep if directory else p)
+    return res
+
+
+def is_hot(path: str, hot_set: list) -> bool:
+    return any(path == p or (p.endswith(os.sep) and path.startswith(p))
+               for p in hot_set)
+
+# output: {path: (method, data, file_digest, chunk_digests)}
+
+
+def generate_md5_table(folder: str, level, large_level=None, solid=False, hot_set=None,
+                       base=None, manifest=None, digest=DIGEST_MD5, chunk_size=0) -> dict:
+    """Files whose digest matches the `base` manifest are skipped, every file
+    is recorded into `manifest` as {path: {<digest name>, "size"}}.
+
+    With a chunk_size, files larger than it also get per-chunk digests so
+    the launcher can rewrite only the changed chunks.
+    """
+    digest_name = DIGEST_NAMES[digest]
+    res: dict = dict()
+    if large_level is None:
+        large_level = level
+    # (hot, cold) small files, hot ones are grouped apart so that the
+    # segments do not pull cold files into the hot set, or the reverse
+    small_files = ([], [])
+    curdir = os.getcwd()
     os.chdir(folder)
     for root, _, files in os.walk('.'):
         # remove ./
         for f in files:
-            md5_generator = md5()
             full_path = os.path.join(root, f)
-            print(f"Processing {full_path}...")
             f = open(full_path, "rb")
             content = f.read()
-            content_compressed = brotli.compress(
-                content, quality=level)
-            md5_generator.update(content)
-            md5_code = md5_generator.hexdigest().encode(encoding=encoding)
-            res[full_path] = (content_compressed, md5_code)
+            f.close()
+            file_digest = hex_digest(content, digest)
+            if manifest is not None:
+                manifest[full_path] = {
+                    digest_name: file_digest.decode(encoding=encoding),
+                    "size": len(content),
+                }
+            # a base manifest using another digest has everything changed
+            if base and base.get(full_path, {}).get(digest_name) == file_digest.decode(encoding=encoding):
+                print(f"Unchanged {full_path}")
+                continue
+            # tiny files rarely pass the sample probe alone, let the
+            # segment decide for them
+            if solid and len(content) < SOLID_FILE_SIZE and \
+                    os.path.splitext(full_path)[1].lower() not in STORED_EXTENSIONS:
+                hot = is_hot(full_path, hot_set or [])
+                small_files[0 if hot else 1].append((full_path, content, file_digest))
+                continue
+            method, data = compress_content(
+                full_path, content, level, large_level)
+            print(f"Processing {full_path}... "
+                  f"{'brotli' if method == METHOD_BROTLI else 'stored'}")
+            chunks = chunk_digests(content, digest, chunk_size) if chunk_size else None
+            res[full_path] = (method, data, file_digest, chunks)
     os.chdir(curdir)
+    res.update(generate_solid_segments(small_files[0], level, digest, hot=True))
+    res.update(generate_solid_segments(small_files[1], level, digest))
     return res
 
 
-def write_package_metadata(md5_table: dict, output_folder: str, exe: str):
+def report_solid_tradeoff(md5_table: dict, level: int):
+    """Compare the solid segments against compressing their files one by one."""
+    raw_size = 0
+    solid_size = 0
+    solid_time = 0.0
+    single_size = 0
+    single_time = 0.0
+    files = 0
+    for (method, data, _, _) in md5_table.values():
+        if method != METHOD_SOLID:
+            continue
+        start = time.perf_counter()
+        segment = brotli.decompress(data)
+        solid_time += time.perf_counter() - start
+        solid_size += len(data)
+        for (_, content, _) in unpack_solid_segment(segment):
+            compressed = brotli.compress(content, quality=level)
+            start = time.perf_counter()
+            brotli.decompress(compressed)
+            single_time += time.perf_counter() - start
+            single_size += len(compressed)
+            raw_size += len(content)
+            files += 1
+    if not files:
+        print("No solid segments")
+        return
+    print(f"Solid: {files} files, {raw_size} bytes raw")
+    print(f"  solid segments: {solid_size} bytes, ratio {solid_size / raw_size:.3f}, "
+          f"decompress {solid_time * 1000:.1f}ms")
+    print(f"  one per file:   {single_size} bytes, ratio {single_size / raw_size:.3f}, "
+          f"decompress {single_time * 1000:.1f}ms")
+
+
+def write_entry(f, path: str, method: int, data: bytes, digest: bytes, chunks=None):
+    path = path.encode(encoding=encoding)
+    # path length & path
+    f.write((len(path)).to_bytes(length=length_count, byteorder='big'))
+    f.write(path)
+    # storage method
+    f.write(method.to_bytes(length=1, byteorder='big'))
+    # data length & compressed data
+    f.write(len(data).to_bytes(length=length_count, byteorder='big'))
+    f.write(data)
+    # digest
+    f.write(digest)
+    # chunk count & chunk digests, only with a chunk size in the header
+    if chunks is not None:
+        f.write(len(chunks).to_bytes(length=length_count, byteorder='big'))
+        for chunk in chunks:
+            f.write(chunk)
+
+
+def write_package_metadata(md5_table: dict, output_folder: str, exe: str, hot_set=None,
+                           digest=DIGEST_MD5, chunk_size=0):
     output_path = os.path.join(output_folder, "data.bin")
+    paths = list(md5_table.keys())
+    if hot_set:
+        hot_paths = [p for p in paths if is_hot(p, hot_set) or p.startswith(HOT_SEGMENT)]
+        # keep the order of the hot set, the executable goes first and the
+        # hot segments last
+        hot_paths.sort(key=lambda p: next((i for i, h in enumerate(hot_set)
+                                           if p == h or (h.endswith(os.sep) and p.startswith(h))),
+                                          len(hot_set)))
+        hot_paths_set = set(hot_paths)
+        paths = hot_paths + [None] + [p for p in paths if p not in hot_paths_set]
+        print(f"Hot set: {len(hot_paths)} of {len(md5_table)} entries")
     with open(output_path, "wb") as f:
         f.write("rustdesk".encode(encoding=encoding))
-        for path in md5_table.keys():
-            (compressed_data, md5_code) = md5_table[path]
-            data_length = len(compressed_data)
-            path = path.encode(encoding=encoding)
-            # path length & path
-            f.write((len(path)).to_bytes(length=length_count, byteorder='big'))
-            f.write(path)
-            # data length & compressed data
-            f.write(data_length.to_bytes(
-                length=length_count, byteorder='big'))
-            f.write(compressed_data)
-            # md5 code
-            f.write(md5_code)
+        # header: digest algorithm & chunk size
+        f.write(digest.to_bytes(length=1, byteorder='big'))
+        f.write(chunk_size.to_bytes(length=length_count, byteorder='big'))
+        for path in paths:
+            if path is None:
+                write_entry(f, '', METHOD_HOT_END, b'', b'0' * digest_length)
+                continue
+            (method, compressed_data, file_digest, chunks) = md5_table[path]
+            if chunk_size and method in (METHOD_STORED, METHOD_BROTLI):
+                chunks = chunks or []
+            write_entry(f, path, method, compressed_data, file_digest, chunks)
         # end
         f.write("rustdesk".encode(encoding=encoding))
         # executable
         f.write(exe.encode(encoding='utf-8'))
     print(f"Metadata has been written to {output_path}")
 
-def write_app_metadata(output_folder: str):
+def add_tombstones(md5_table: dict, base: dict, manifest: dict):
+    for path in base:
+        if path not in manifest:
+            print(f"Deleted {path}")
+            md5_table[path] = (METHOD_DELETED, b'', b'0' * digest_length, None)
+
+
+def read_manifest(path: str) -> dict:
+    with open(path, encoding=encoding) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest: dict, output_folder: str, exe: str, timestamp: int):
+    output_path = os.path.join(output_folder, "manifest.json")
+    with open(output_path, "w", encoding=encoding) as f:
+        json.dump({
+            "timestamp": timestamp,
+            "executable": exe,
+            "files": manifest,
+        }, f, indent=1, sort_keys=True)
+    print(f"Manifest has been written to {output_path}")
+
+
+def write_app_metadata(output_folder: str, timestamp: int, base_timestamp=None):
     output_path = os.path.join(output_folder, "app_metadata.toml")
     with open(output_path, "w") as f:
-        f.write(f"timestamp = {int(datetime.datetime.now().timestamp() * 1000)}\n")
+        f.write(f"timestamp = {timestamp}\n")
+        if base_timestamp is not None:
+            # delta package, only applies on top of this version
+            f.write(f"base_timestamp = {base_timestamp}\n")
     print(f"App metadata has been written to {output_path}")
 
 def build_portable(output_folder: str, target: str):
     os.chdir(output_folder)
     if target:
-        os.system("cargo build --release --target " + target)
+        status = os.system("cargo build --release --target " + target)
     else:
-        os.system("cargo build --release")
+        status = os.system("cargo build --release")
+    # build.py packs whatever packer is left in target/, it must not be the
+    # one of an earlier build
+    if status != 0:
+        print("cargo build of the portable packer failed")
+        sys.exit(1)
+
+# Reading data.bin back, entries are zero-copy memoryview slices of the
+# mmapped package.
+# output: ([(path, method, data, digest, chunk_digests)], exe, digest, chunk_size)
+
+
+def read_package(view: memoryview):
+    identifier = "rustdesk".encode(encoding=encoding)
+    if view[:len(identifier)] != identifier:
+        raise ValueError("not a rustdesk package")
+    pos = len(identifier)
+    digest = view[pos]
+    pos += 1
+    chunk_size = int.from_bytes(view[pos:pos + length_count], byteorder='big')
+    pos += length_count
+    entries = []
+    while view[pos:pos + len(identifier)] != identifier:
+        path_length = int.from_bytes(view[pos:pos + length_count], byteorder='big')
+        pos += length_count
+        path = bytes(view[pos:pos + path_length]).decode(encoding=encoding)
+        pos += path_length
+        method = view[pos]
+        pos += 1
+        data_length = int.from_bytes(view[pos:pos + length_count], byteorder='big')
+        pos += length_count
+        data = view[pos:pos + data_length]
+        pos += data_length
+        file_digest = bytes(view[pos:pos + digest_length])
+        pos += digest_length
+        if len(file_digest) != digest_length:
+            raise ValueError(f"truncated package at {path}")
+        chunks = None
+        if chunk_size and method in (METHOD_STORED, METHOD_BROTLI):
+            count = int.from_bytes(view[pos:pos + length_count], byteorder='big')
+            pos += length_count
+            chunks = [bytes(view[pos + i * digest_length:pos + (i + 1) * digest_length])
+                      for i in range(count)]
+            pos += count * digest_length
+        entries.append((path, method, data, file_digest, chunks))
+    pos += len(identifier)
+    exe = bytes(view[pos:]).decode(encoding=encoding)
+    return entries, exe, digest, chunk_size
+
+
+def expand_entry(entry, digest=DIGEST_MD5) -> list:
+    """Return the files of an entry as [(path, content, digest)]."""
+    (path, method, data, file_digest, _) = entry
+    if method == METHOD_STORED:
+        return [(path, data, file_digest)]
+    if method == METHOD_BROTLI:
+        return [(path, brotli.decompress(data), file_digest)]
+    if method == METHOD_SOLID:
+        segment = brotli.decompress(data)
+        if hex_digest(segment, digest) != file_digest:
+            raise ValueError(f"digest mismatch in {path}")
+        return unpack_solid_segment(segment)
+    return []
+
+
+def verify_entry(entry, digest=DIGEST_MD5, chunk_size=0) -> list:
+    """Return the paths failing decompression, digest or chunk digest check."""
+    try:
+        files = expand_entry(entry, digest)
+    except (brotli.error, ValueError) as e:
+        return [f"{entry[0]}: {e}"]
+    errors = [f"{path}: digest mismatch" for (path, content, file_digest) in files
+              if hex_digest(content, digest) != file_digest]
+    chunks = entry[4]
+    if chunks is not None and files and \
+            chunks != chunk_digests(files[0][1], digest, chunk_size):
+        errors.append(f"{entry[0]}: chunk digest mismatch")
+    return errors
+
+
+def method_name(method: int) -> str:
+    return {
+        METHOD_STORED: 'stored',
+        METHOD_BROTLI: 'brotli',
+        METHOD_SOLID: 'solid',
+        METHOD_HOT_END: 'hot-end',
+        METHOD_DELETED: 'deleted',
+    }.get(method, f'unknown({method})')
+
+
+def open_package(path: str):
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def describe_entry(entry) -> list:
+    (path, method, data, _, chunks) = entry
+    lines = [f"{method_name(method):>8} {len(data):>10} {path}" +
+             (f" ({len(chunks)} chunks)" if chunks else "")]
+    if method == METHOD_SOLID:
+        for (member, content, _) in unpack_solid_segment(brotli.decompress(data)):
+            lines.append(f"{'':>8} {len(content):>10}   {member}")
+    return lines
+
+
+def list_package(path: str):
+    mm = open_package(path)
+    entries, exe, digest, chunk_size = read_package(memoryview(mm))
+    for lines in map(describe_entry, entries):
+        print("\n".join(lines))
+    print(f"{len(entries)} entries, executable {exe}, {DIGEST_NAMES.get(digest, digest)} digest"
+          + (f", {chunk_size} bytes chunks" if chunk_size else ""))
+    # release the slices before closing the mapping
+    del entries
+    mm.close()
+
+
+def verify_package(path: str, jobs=None) -> bool:
+    mm = open_package(path)
+    entries, _, digest, chunk_size = read_package(memoryview(mm))
+    start = time.perf_counter()
+    verify = partial(verify_entry, digest=digest, chunk_size=chunk_size)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        errors = [e for res in executor.map(verify, entries) for e in res]
+    for e in errors:
+        print(e)
+    print(f"{len(entries)} entries verified in {time.perf_counter() - start:.2f}s, "
+          f"{len(errors)} errors")
+    del entries
+    mm.close()
+    return not errors
+
+
+def extract_package(path: str, output_folder: str, jobs=None):
+    mm = open_package(path)
+    entries, _, digest, _ = read_package(memoryview(mm))
+
+    def extract(entry):
+        for (file_path, content, _) in expand_entry(entry, digest):
+            target = os.path.join(output_folder, file_path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(content)
+        if entry[1] == METHOD_DELETED:
+            target = os.path.join(output_folder, entry[0])
+            if os.path.exists(target):
+                os.remove(target)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        list(executor.map(extract, entries))
+    print(f"{len(entries)} entries extracted to {output_folder}")
+    del entries
+    mm.close()
 
 # Linux: python3 generate.py -f ../rustdesk-portable-packer/test -o . -e ./test/main.py
 # Windows: python3 .\generate.py -f ..\rustdesk\flutter\build\windows\runner\Debug\ -o . -e ..\rustdesk\flutter\build\windows\runner\Debug\rustdesk.exe
+# Inspect: python3 generate.py list|verify [data.bin]
+#          python3 generate.py extract [data.bin] -f <output folder>
 
 
 if __name__ == '__main__':
-    parser = optparse.OptionParser()
+    parser = optparse.OptionParser(
+        usage="%prog [options]\n       %prog list|verify|extract [data.bin] [options]")
     parser.add_option("-f", "--folder", dest="folder",
                       help="folder to compress")
     parser.add_option("-o", "--output", dest="output_folder",
@@ -87,10 +602,43 @@ if __name__ == '__main__':
                       help="the target used by cargo")
     parser.add_option("-l", "--level", dest="level", type="int",
                       help="compression level, default is 11, highest", default=11)
+    parser.add_option("--large-level", dest="large_level", type="int",
+                      help=f"compression level for files larger than {LARGE_FILE_SIZE >> 20}MB, default is --level")
+    parser.add_option("--solid", dest="solid", action="store_true", default=False,
+                      help=f"group files smaller than {SOLID_FILE_SIZE >> 10}KB into solid segments")
+    parser.add_option("--solid-report", dest="solid_report", action="store_true", default=False,
+                      help="with --solid, report size and decompression time against per-file compression")
+    parser.add_option("--hot-set", dest="hot_set",
+                      help="file listing the paths needed at startup, one per line, "
+                           "default is derived from the executable imports and the flutter engine")
+    parser.add_option("--no-hot-set", dest="no_hot_set", action="store_true", default=False,
+                      help="do not write the hot set first, the launcher extracts everything before starting")
+    parser.add_option("--delta-from", dest="delta_from",
+                      help="manifest.json of the previous release, only pack the files changed since then")
+    parser.add_option("--digest", dest="digest", choices=list(DIGEST_NAMES.values()),
+                      default=DIGEST_NAMES[DIGEST_BLAKE2B],
+                      help="file digest, blake2b (default, faster) or md5, see bench.py for their speed")
+    parser.add_option("--chunk-size", dest="chunk_size", type="int", default=0,
+                      help="also store a digest per chunk of this many KB for larger files, "
+                           "the launcher then only rewrites the changed chunks")
+    parser.add_option("-j", "--jobs", dest="jobs", type="int",
+                      help="threads used by verify and extract, default is the cpu count")
     (options, args) = parser.parse_args()
     folder = options.folder or './rustdesk'
     output_folder = os.path.abspath(options.output_folder or './')
 
+    if args and args[0] in ('list', 'verify', 'extract'):
+        package = args[1] if len(args) > 1 else os.path.join(
+            output_folder, "data.bin")
+        if args[0] == 'list':
+            list_package(package)
+        elif args[0] == 'verify':
+            if not verify_package(package, options.jobs):
+                sys.exit(1)
+        else:
+            extract_package(package, folder, options.jobs)
+        sys.exit(0)
+
     if not options.executable:
         options.executable = 'rustdesk.exe'
     if not options.executable.startswith(folder):
@@ -102,7 +650,30 @@ if __name__ == '__main__':
     exe = '.' + exe[len(os.path.abspath(folder)):]
     print("Executable path: " + exe)
     print("Compression level: " + str(options.level))
-    md5_table = generate_md5_table(folder, options.level)
-    write_package_metadata(md5_table, output_folder, exe)
-    write_app_metadata(output_folder)
+    hot_set = None
+    if options.hot_set:
+        hot_set = normalize_hot_set(read_hot_set(options.hot_set))
+    elif not options.no_hot_set:
+        hot_set = normalize_hot_set(derive_hot_set(folder, exe))
+    base = None
+    base_timestamp = None
+    if options.delta_from:
+        base_manifest = read_manifest(options.delta_from)
+        base = base_manifest["files"]
+        base_timestamp = base_manifest["timestamp"]
+        print(f"Delta from {options.delta_from}, {len(base)} files")
+    timestamp = int(datetime.datetime.now().timestamp() * 1000)
+    manifest = dict()
+    digest = next(k for k, v in DIGEST_NAMES.items() if v == options.digest)
+    chunk_size = options.chunk_size * 1024
+    md5_table = generate_md5_table(
+        folder, options.level, options.large_level, options.solid, hot_set,
+        base, manifest, digest, chunk_size)
+    if base is not None:
+        add_tombstones(md5_table, base, manifest)
+    if options.solid and options.solid_report:
+        report_solid_tradeoff(md5_table, options.level)
+    write_package_metadata(md5_table, output_folder, exe, hot_set, digest, chunk_size)
+    write_manifest(manifest, output_folder, exe, timestamp)
+    write_app_metadata(output_folder, timestamp, base_timestamp)
     build_portable(output_folder, options.target)
@@ -1,6 +1,7 @@
+use blake2::{digest::consts::U16, Blake2b, Digest};
 use std::{
     fs::{self},
-    io::{Cursor, Read},
+    io::{Cursor, Read, Seek, SeekFrom, Write},
     path::Path,
 };
 
@@ -11,11 +12,29 @@ const BIN_DATA: &[u8] = &[];
 // 4bytes
 const LENGTH: usize = 4;
 const IDENTIFIER_LENGTH: usize = 8;
-const MD5_LENGTH: usize = 32;
+// hex md5 or 128 bits blake2b
+const DIGEST_LENGTH: usize = 32;
 const BUF_SIZE: usize = 4096;
+// storage method of an entry, must match generate.py
+const METHOD_STORED: u8 = 0;
+const METHOD_BROTLI: u8 = 1;
+// brotli compressed group of entries without the method byte
+const METHOD_SOLID: u8 = 2;
+// empty entry, the entries before it are enough to start the executable
+const METHOD_HOT_END: u8 = 3;
+// tombstone of a delta package
+const METHOD_DELETED: u8 = 4;
+// digest algorithm in the header, must match generate.py
+const DIGEST_MD5: u8 = 0;
+const DIGEST_BLAKE2B: u8 = 1;
 
 pub(crate) struct BinaryData {
-    pub md5_code: &'static [u8],
+    pub method: u8,
+    pub digest_algorithm: u8,
+    pub digest: &'static [u8],
+    // digests of each chunk_size piece, empty for small files
+    pub chunk_size: usize,
+    pub chunk_digests: Vec<&'static [u8]>,
     // compressed gzip data
     pub raw: &'static [u8],
     pub path: String,
@@ -24,59 +43,150 @@ pub(crate) struct BinaryData {
 pub(crate) struct BinaryReader {
     pub files: Vec<BinaryData>,
     pub exe: String,
+    // number of leading files needed to start the executable
+    pub hot_count: usize,
 }
 
 impl Default for BinaryReader {
     fn default() -> Self {
-        let (files, exe) = BinaryReader::read();
-        Self { files, exe }
+        let (files, exe, hot_count) = BinaryReader::read();
+        Self {
+            files,
+            exe,
+            hot_count,
+        }
+    }
+}
+
+fn brotli_decompress(raw: &[u8]) -> Vec<u8> {
+    let cursor = Cursor::new(raw);
+    let mut decoder = brotli::Decompressor::new(cursor, BUF_SIZE);
+    let mut buf = Vec::new();
+    decoder.read_to_end(&mut buf).ok();
+    buf
+}
+
+fn hex_digest(algorithm: u8, data: &[u8]) -> String {
+    if algorithm == DIGEST_BLAKE2B {
+        format!("{:x}", Blake2b::<U16>::digest(data))
+    } else {
+        debug_assert_eq!(algorithm, DIGEST_MD5);
+        format!("{:x}", md5::compute(data))
     }
 }
 
+fn read_length(data: &[u8], pos: usize) -> usize {
+    u32::from_be_bytes([data[pos], data[pos + 1], data[pos + 2], data[pos + 3]]) as usize
+}
+
 impl BinaryData {
     fn decompress(&self) -> Vec<u8> {
-        let cursor = Cursor::new(self.raw);
-        let mut decoder = brotli::Decompressor::new(cursor, BUF_SIZE);
-        let mut buf = Vec::new();
-        decoder.read_to_end(&mut buf).ok();
-        buf
+        if self.method == METHOD_STORED {
+            return self.raw.to_vec();
+        }
+        debug_assert_eq!(self.method, METHOD_BROTLI);
+        brotli_decompress(self.raw)
     }
 
     pub fn write_to_file(&self, prefix: &Path) {
         let p = prefix.join(&self.path);
+        if self.method == METHOD_DELETED {
+            if p.exists() {
+                println!("deleting {}", p.display());
+                let _ = fs::remove_file(p);
+            }
+            return;
+        }
         if let Some(parent) = p.parent() {
             if !parent.exists() {
                 let _ = fs::create_dir_all(parent);
             }
         }
         if p.exists() {
-            // check md5
-            let f = fs::read(p.clone()).unwrap_or_default();
-            let digest = format!("{:x}", md5::compute(&f));
-            let md5_record = String::from_utf8_lossy(self.md5_code);
-            if digest == md5_record {
-                // same, skip this file
-                println!("skip {}", &self.path);
-                return;
+            if !self.chunk_digests.is_empty() {
+                if self.write_changed_chunks(&p) {
+                    return;
+                }
             } else {
-                println!("writing {}", p.display());
-                println!("{} -> {}", md5_record, digest)
+                // check digest
+                let f = fs::read(p.clone()).unwrap_or_default();
+                let digest = hex_digest(self.digest_algorithm, &f);
+                let digest_record = String::from_utf8_lossy(self.digest);
+                if digest == digest_record {
+                    // same, skip this file
+                    println!("skip {}", &self.path);
+                    return;
+                } else {
+                    println!("writing {}", p.display());
+                    println!("{} -> {}", digest_record, digest)
+                }
             }
         }
         let _ = fs::write(p, self.decompress());
     }
+
+    // Compare the existing file chunk by chunk and rewrite only the chunks
+    // that differ. Returns false if the file could not be updated in place.
+    fn write_changed_chunks(&self, p: &Path) -> bool {
+        let Ok(mut f) = fs::OpenOptions::new().read(true).write(true).open(p) else {
+            return false;
+        };
+        let mut changed = vec![];
+        let mut chunk = Vec::with_capacity(self.chunk_size);
+        for (i, digest_record) in self.chunk_digests.iter().enumerate() {
+            chunk.clear();
+            if (&mut f)
+                .take(self.chunk_size as u64)
+                .read_to_end(&mut chunk)
+                .is_err()
+            {
+                return false;
+            }
+            if hex_digest(self.digest_algorithm, &chunk).as_bytes() != *digest_record {
+                changed.push(i);
+            }
+        }
+        // longer than the last chunk
+        let mut tail = [0u8; 1];
+        let truncate = !matches!(f.read(&mut tail), Ok(0));
+        if changed.is_empty() && !truncate {
+            println!("skip {}", &self.path);
+            return true;
+        }
+        println!("writing {} chunks of {}", changed.len(), p.display());
+        let data = self.decompress();
+        if f.set_len(data.len() as u64).is_err() {
+            return false;
+        }
+        for i in changed {
+            let start = i * self.chunk_size;
+            let end = std::cmp::min(start + self.chunk_size, data.len());
+            if f.seek(SeekFrom::Start(start as u64)).is_err()
+                || f.write_all(&data[start..end]).is_err()
+            {
+                return false;
+            }
+        }
+        true
+    }
 }
 
 impl BinaryReader {
-    fn read() -> (Vec<BinaryData>, String) {
+    fn read() -> (Vec<BinaryData>, String, usize) {
         let mut base: usize = 0;
         let mut parsed = vec![];
+        let mut hot_count = None;
         assert!(BIN_DATA.len() > IDENTIFIER_LENGTH, "bin data invalid!");
         let mut iden = String::from_utf8_lossy(&BIN_DATA[base..base + IDENTIFIER_LENGTH]);
         if iden != "rustdesk" {
             panic!("bin file is not valid!");
         }
         base += IDENTIFIER_LENGTH;
+        // header: digest algorithm & chunk size
+        let digest_algorithm = BIN_DATA[base];
+        base += 1;
+        let chunk_size = read_length(BIN_DATA, base);
+        base += LENGTH;
         loop {
             iden = String::from_utf8_lossy(&BIN_DATA[base..base + IDENTIFIER_LENGTH]);
             if iden == "rustdesk" {
@@ -96,6 +206,9 @@ impl BinaryReader {
                 String::from_utf8_lossy(&BIN_DATA[base + offset..base + offset + path_length])
                     .to_string();
             offset += path_length;
+            // storage method
+            let method = BIN_DATA[base + offset];
+            offset += 1;
             // file sz
             let file_length = u32::from_be_bytes([
                 BIN_DATA[base + offset],
@@ -106,19 +219,75 @@ impl BinaryReader {
             offset += LENGTH;
             let raw = &BIN_DATA[base + offset..base + offset + file_length];
             offset += file_length;
-            // md5
-            let md5 = &BIN_DATA[base + offset..base + offset + MD5_LENGTH];
-            offset += MD5_LENGTH;
-            parsed.push(BinaryData {
-                md5_code: md5,
-                raw: raw,
-                path: path,
-            });
+            // digest
+            let digest = &BIN_DATA[base + offset..base + offset + DIGEST_LENGTH];
+            offset += DIGEST_LENGTH;
+            // chunk count & chunk digests
+            let mut chunk_digests = vec![];
+            if chunk_size > 0 && (method == METHOD_STORED || method == METHOD_BROTLI) {
+                let count = read_length(BIN_DATA, base + offset);
+                offset += LENGTH;
+                for _ in 0..count {
+                    chunk_digests.push(&BIN_DATA[base + offset..base + offset + DIGEST_LENGTH]);
+                    offset += DIGEST_LENGTH;
+                }
+            }
+            if method == METHOD_HOT_END {
+                hot_count = Some(parsed.len());
+            } else if method == METHOD_SOLID {
+                Self::read_solid_segment(raw, digest_algorithm, &mut parsed);
+            } else {
+                parsed.push(BinaryData {
+                    method,
+                    digest_algorithm,
+                    digest,
+                    chunk_size,
+                    chunk_digests,
+                    raw: raw,
+                    path: path,
+                });
+            }
             base += offset;
         }
         // executable
         let executable = String::from_utf8_lossy(&BIN_DATA[base..]).to_string();
-        (parsed, executable)
+        let hot_count = hot_count.unwrap_or(parsed.len());
+        (parsed, executable, hot_count)
+    }
+
+    pub fn hot_files(&self) -> &[BinaryData] {
+        &self.files[..self.hot_count]
+    }
+
+    pub fn cold_files(&self) -> &[BinaryData] {
+        &self.files[self.hot_count..]
+    }
+
+    fn read_solid_segment(raw: &[u8], digest_algorithm: u8, parsed: &mut Vec<BinaryData>) {
+        // The launcher extracts once and exits, keep the segment for its lifetime.
+        let segment: &'static [u8] = Box::leak(brotli_decompress(raw).into_boxed_slice());
+        let mut pos = 0;
+        while pos < segment.len() {
+            let path_length = read_length(segment, pos);
+            pos += LENGTH;
+            let path = String::from_utf8_lossy(&segment[pos..pos + path_length]).to_string();
+            pos += path_length;
+            let file_length = read_length(segment, pos);
+            pos += LENGTH;
+            let raw = &segment[pos..pos + file_length];
+            pos += file_length;
+            let digest = &segment[pos..pos + DIGEST_LENGTH];
+            pos += DIGEST_LENGTH;
+            parsed.push(BinaryData {
+                method: METHOD_STORED,
+                digest_algorithm,
+                digest,
+                chunk_size: 0,
+                chunk_digests: vec![],
+                raw,
+                path,
+            });
+        }
     }
 
     #[cfg(linux)]
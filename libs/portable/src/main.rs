@@ -16,7 +16,12 @@ const APP_METADATA: &[u8] = include_bytes!("../app_metadata.toml");
 #[cfg(not(windows))]
 const APP_METADATA: &[u8] = &[];
 const APP_METADATA_CONFIG: &str = "meta.toml";
+// Written before the first file and removed after meta.toml, a launch during
+// the extraction must not take the directory for a stale install and remove
+// it under the running app.
+const APP_EXTRACTING_MARKER: &str = "meta.toml.extracting";
 const META_LINE_PREFIX_TIMESTAMP: &str = "timestamp = ";
+const META_LINE_PREFIX_BASE_TIMESTAMP: &str = "base_timestamp = ";
 const APP_PREFIX: &str = "rustdesk";
 const APPNAME_RUNTIME_ENV_KEY: &str = "RUSTDESK_APPNAME";
 #[cfg(windows)]
@@ -50,6 +55,23 @@ fn is_timestamp_matches(dir: &Path, ts: &mut u64) -> bool {
     false
 }
 
+// Delta packages only contain the changes since the base version.
+fn delta_base_matches(dir: &Path) -> Option<bool> {
+    let app_metadata = std::str::from_utf8(APP_METADATA).ok()?;
+    let base_ts = app_metadata.lines().find_map(|line| {
+        line.strip_prefix(META_LINE_PREFIX_BASE_TIMESTAMP)?
+            .parse::<u64>()
+            .ok()
+    })?;
+    let content = std::fs::read_to_string(dir.join(APP_METADATA_CONFIG)).unwrap_or_default();
+    let installed_ts = content.lines().find_map(|line| {
+        line.strip_prefix(META_LINE_PREFIX_TIMESTAMP)?
+            .parse::<u64>()
+            .ok()
+    });
+    Some(installed_ts == Some(base_ts))
+}
+
 fn write_meta(dir: &Path, ts: u64) {
     let meta_file = dir.join(APP_METADATA_CONFIG);
     if ts != 0 {
@@ -57,15 +79,35 @@ fn write_meta(dir: &Path, ts: u64) {
         // Ignore is ok here
         let _ = std::fs::write(meta_file, content);
     }
+    let _ = std::fs::remove_file(dir.join(APP_EXTRACTING_MARKER));
+}
+
+// Whether a launch of the same version is extracting into dir.
+fn is_extracting(dir: &Path, ts: u64) -> bool {
+    let content = std::fs::read_to_string(dir.join(APP_EXTRACTING_MARKER)).unwrap_or_default();
+    ts != 0
+        && content.lines().find_map(|line| {
+            line.strip_prefix(META_LINE_PREFIX_TIMESTAMP)?
+                .parse::<u64>()
+                .ok()
+        }) == Some(ts)
+}
+
+fn mark_extracting(dir: &Path, ts: u64) {
+    if ts != 0 {
+        let _ = std::fs::create_dir_all(dir);
+        let content = format!("{}{}", META_LINE_PREFIX_TIMESTAMP, ts);
+        let _ = std::fs::write(dir.join(APP_EXTRACTING_MARKER), content);
+    }
 }
 
 fn setup(
-    reader: BinaryReader,
+    reader: &BinaryReader,
     dir: Option<PathBuf>,
     clear: bool,
     _args: &Vec<String>,
     _ui: &mut bool,
-) -> Option<PathBuf> {
+) -> Option<(PathBuf, u64)> {
     let dir = if let Some(dir) = dir {
         dir
     } else {
@@ -79,7 +121,16 @@ fn setup(
     };
 
     let mut ts = 0;
-    if clear || !is_timestamp_matches(&dir, &mut ts) {
+    let timestamp_matches = is_timestamp_matches(&dir, &mut ts);
+    let delta_base = delta_base_matches(&dir);
+    if delta_base == Some(false) && !timestamp_matches {
+        eprintln!("the base version of this update is not installed");
+        return None;
+    }
+    // a delta is applied on top of the installed files, and the files of
+    // a running extraction of this version are reused, they are only
+    // rewritten if they differ
+    if delta_base.is_none() && (clear || !timestamp_matches) && !is_extracting(&dir, ts) {
         #[cfg(windows)]
         if _args.is_empty() {
             *_ui = true;
@@ -87,15 +138,25 @@ fn setup(
         }
         std::fs::remove_dir_all(&dir).ok();
     }
-    for file in reader.files.iter() {
+    if clear || !timestamp_matches {
+        mark_extracting(&dir, ts);
+    }
+    for file in reader.hot_files() {
         file.write_to_file(&dir);
     }
-    write_meta(&dir, ts);
     #[cfg(windows)]
     windows::copy_runtime_broker(&dir);
     #[cfg(linux)]
     reader.configure_permission(&dir);
-    Some(dir.join(&reader.exe))
+    Some((dir, ts))
+}
+
+// Extract the files not needed at startup, the executable may already be running.
+fn finish_setup(reader: &BinaryReader, dir: &Path, ts: u64) {
+    for file in reader.cold_files() {
+        file.write_to_file(dir);
+    }
+    write_meta(dir, ts);
 }
 
 fn execute(path: PathBuf, args: Vec<String>, _ui: bool) {
@@ -151,19 +212,23 @@ fn main() {
 
     let mut ui = false;
     let reader = BinaryReader::default();
-    if let Some(exe) = setup(
-        reader,
-        None,
-        click_setup || args.contains(&"--silent-install".to_owned()),
-        &args,
-        &mut ui,
-    ) {
+    let clear = click_setup || args.contains(&"--silent-install".to_owned());
+    // installing copies the whole directory, extract everything before starting
+    let extract_all = clear || args.contains(&"--install".to_owned());
+    if let Some((dir, ts)) = setup(&reader, None, clear, &args, &mut ui) {
+        if extract_all {
+            finish_setup(&reader, &dir, ts);
+        }
+        let exe = dir.join(&reader.exe);
         if click_setup {
             args = vec!["--install".to_owned()];
         } else if quick_support {
             args = vec!["--quick_support".to_owned()];
         }
         execute(exe, args, ui);
+        if !extract_all {
+            finish_setup(&reader, &dir, ts);
+        }
     }
 }
 
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+
+# Helpers shared by the source generators in this directory.
+
+import os
+import hashlib
+
+
+def write_if_changed(path, content):
+    """Write content as a text mode write would, unless the file already has
+    it, so cargo does not rebuild for a new mtime. Return True if written.
+
+    The file is replaced atomically, readers never see it half written, and
+    keeps its mode.
+    """
+    data = content.replace('\n', os.linesep).encode('utf8')
+    mode = None
+    try:
+        with open(path, 'rb') as f:
+            if hashlib.sha256(f.read()).digest() == hashlib.sha256(data).digest():
+                return False
+            mode = os.stat(f.fileno()).st_mode
+    except FileNotFoundError:
+        pass
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    if mode is not None:
+        os.chmod(tmp, mode)
+    os.replace(tmp, path)
+    return True
@@ -2,6 +2,8 @@
 
 import re
 
+from codegen import write_if_changed
+
 
 def strip(s): return re.sub(r'\s+\n', '\n', re.sub(r'\n\s+', '\n', s))
 
@@ -41,15 +43,15 @@ def compress(s):
                                                                                   r'\"') + '"'
 
 
-with open('src/ui/inline.rs', 'wt') as fh:
-    fh.write('const _COMMON_CSS: ' + compress(strip(common_css)) + ';\n')
-    fh.write('const _COMMON_TIS: ' + compress(strip(common_tis)) + ';\n')
-    fh.write('const _INDEX: ' + compress(strip(index)) + ';\n')
-    fh.write('const _REMOTE: ' + compress(strip(remote)) + ';\n')
-    fh.write('const _CHATBOX: ' + compress(strip(chatbox)) + ';\n')
-    fh.write('const _INSTALL: ' + compress(strip(install)) + ';\n')
-    fh.write('const _CONNECTION_MANAGER: ' + compress(strip(cm)) + ';\n')
-    fh.write('''
+out = []
+out.append('const _COMMON_CSS: ' + compress(strip(common_css)) + ';\n')
+out.append('const _COMMON_TIS: ' + compress(strip(common_tis)) + ';\n')
+out.append('const _INDEX: ' + compress(strip(index)) + ';\n')
+out.append('const _REMOTE: ' + compress(strip(remote)) + ';\n')
+out.append('const _CHATBOX: ' + compress(strip(chatbox)) + ';\n')
+out.append('const _INSTALL: ' + compress(strip(install)) + ';\n')
+out.append('const _CONNECTION_MANAGER: ' + compress(strip(cm)) + ';\n')
+out.append('''
 fn get(data: &[u8]) -> String {
     String::from_utf8_lossy(data).to_string()
 }
@@ -80,3 +82,6 @@ pub fn get_cm() -> String {
     replace(&_CONNECTION_MANAGER[..])
 }
 ''')
+
+changed = write_if_changed('src/ui/inline.rs', ''.join(out))
+print('%d of 1 files changed' % changed)
@@ -1,9 +1,34 @@
 #!/usr/bin/env python3
 
 import os
+import re
 import glob
 import sys
 import csv
+from multiprocessing import Pool
+
+from codegen import write_if_changed
+
+# A language table is either a HashMap built on its first lookup, or const rows
+# with an index listing them sorted by key, which is binary searched, so
+# nothing is built at runtime, see Table in src/lang.rs. Both forms keep the
+# rows in the template order, `lang.py static` and `lang.py lazy` switch all
+# files by rewriting the lines around the rows.
+LAZY_HEADER = '''lazy_static::lazy_static! {
+pub static ref T: std::collections::HashMap<&'static str, &'static str> =
+    [
+'''
+LAZY_FOOTER = '''    ].iter().cloned().collect();
+}
+'''
+STATIC_HEADER = '''pub static T: &crate::lang::Table = crate::lang::table!(
+    &[
+'''
+STATIC_FOOTER = '''    ],
+    &[%s],
+);
+'''
+STATIC_FOOTER_RE = re.compile(r'    \],\n    &\[[0-9, ]*\],\n\);\n\Z')
 
 
 def get_lang(lang):
@@ -33,30 +58,102 @@ def main():
         expand()
     elif sys.argv[1] == '1':
         to_csv()
+    elif sys.argv[1] in ['static', 'lazy']:
+        convert(sys.argv[1] == 'static')
     else:
         to_rs(sys.argv[1])
 
 
+def parse_template(fn='./src/lang/template.rs'):
+    """Parse a language file into a list of lines, where translation lines are
+    split as (head, key, value, tail) and the others are kept as strings."""
+    model = []
+    for line in open(fn, encoding='utf8'):
+        if line.strip().startswith('("'):
+            # checks the line, then split at the same positions as line_split
+            # does, in the unstripped line
+            line_split(line.strip())
+            start = line.index('("') + 2
+            sep = line.index('", "', start)
+            end = line.rindex('"')
+            model.append((line[:start], line[start:sep], line[sep + 4:end], line[end:]))
+        else:
+            model.append(line)
+    return model
+
+
+def render(model, dict):
+    out = []
+    for item in model:
+        if isinstance(item, str):
+            out.append(item)
+        else:
+            head, k, v, tail = item
+            # untranslated keys get an empty value
+            out.append('%s%s", "%s%s' % (head, k, dict.get(k, ''), tail))
+    return ''.join(out)
+
+
+def is_static(model):
+    return ''.join(model[:2]) == STATIC_HEADER
+
+
+def unescape(s):
+    """The value of a Rust string literal body."""
+    simple = {'n': '\n', 'r': '\r', 't': '\t', '0': '\0'}
+    return re.sub(r'\\(u\{([0-9a-fA-F]+)\}|x([0-9a-fA-F]{2})|.)',
+                  lambda m: chr(int(m.group(2) or m.group(3), 16)) if m.group(2) or m.group(3)
+                  else simple.get(m.group(1), m.group(1)), s)
+
+
+def sorted_index(keys):
+    """Row numbers sorted as Table in src/lang.rs expects, by the bytes of
+    the key, then by row."""
+    keys = [unescape(k).encode('utf8') for k in keys]
+    return sorted(range(len(keys)), key=lambda i: keys[i])
+
+
+def set_form(content, static):
+    """Return a language file in the static or the lazy form, with the rows
+    as they are and the index of the static form computed again."""
+    if content.startswith(LAZY_HEADER) and content.endswith(LAZY_FOOTER):
+        rows = content[len(LAZY_HEADER):len(content) - len(LAZY_FOOTER)]
+    elif content.startswith(STATIC_HEADER) and STATIC_FOOTER_RE.search(content):
+        rows = content[len(STATIC_HEADER):STATIC_FOOTER_RE.search(content).start()]
+    else:
+        raise Exception('language file in neither form:\n' + content[:200])
+    if not static:
+        return LAZY_HEADER + rows + LAZY_FOOTER
+    keys = [line_split(ln.strip())[0] for ln in rows.splitlines() if ln.strip().startswith('("')]
+    return STATIC_HEADER + rows + STATIC_FOOTER % ', '.join(map(str, sorted_index(keys)))
+
+
+def render_table(items, static):
+    """Render (key, value) pairs, escaped as in the source, in a table form."""
+    rows = ''.join('        ("%s", "%s"),\n' % (k, v) for k, v in items)
+    return set_form(LAZY_HEADER + rows + LAZY_FOOTER, static)
+
+
+def expand_lang(args):
+    (lang, model) = args
+    # the index of the template may be stale if keys were added by hand
+    content = set_form(render(model, get_lang(lang)), is_static(model))
+    return lang, write_if_changed("./src/lang/%s.rs" % lang, content)
+
+
 def expand():
+    model = parse_template()
+    langs = []
     for fn in glob.glob('./src/lang/*.rs'):
         lang = os.path.basename(fn)[:-3]
         if lang in ['en', 'template']: continue
-        print(lang)
-        dict = get_lang(lang)
-        fw = open("./src/lang/%s.rs" % lang, "wt", encoding='utf8')
-        for line in open('./src/lang/template.rs', encoding='utf8'):
-            line_strip = line.strip()
-            if line_strip.startswith('("'):
-                k, v = line_split(line_strip)
-                if k in dict:
-                    # embraced with " to avoid empty v
-                    line = line.replace('"%s"' % v, '"%s"' % dict[k])
-                else:
-                    line = line.replace(v, "")
-                fw.write(line)
-            else:
-                fw.write(line)
-        fw.close()
+        langs.append(lang)
+    touched = 0
+    with Pool() as pool:
+        for lang, changed in pool.imap(expand_lang, [(lang, model) for lang in langs]):
+            print(lang + (' (changed)' if changed else ''))
+            touched += changed
+    print('%d of %d files changed' % (touched, len(langs)))
 
 
 def to_csv():
@@ -74,17 +171,26 @@ def to_csv():
 
 def to_rs(lang):
     csvfile = open('%s.csv' % lang, "rt", encoding='utf8')
-    fw = open("./src/lang/%s.rs" % lang, "wt", encoding='utf8')
-    fw.write('''lazy_static::lazy_static! {
-pub static ref T: std::collections::HashMap<&'static str, &'static str> =
-    [
-''')
-    for row in csv.reader(csvfile):
-        fw.write('        ("%s", "%s"),\n' % (row[0].replace('"', '\"'), row[1].replace('"', '\"')))
-    fw.write('''    ].iter().cloned().collect();
-}
-''')
-    fw.close()
+    items = [(row[0].replace('"', '\"'), row[1].replace('"', '\"')) for row in csv.reader(csvfile)]
+    csvfile.close()
+    # same form as the template
+    content = render_table(items, is_static(parse_template()))
+    changed = write_if_changed("./src/lang/%s.rs" % lang, content)
+    print('%d of 1 files changed' % changed)
+
+
+def convert(static):
+    """Rewrite every language file, the template included, in the static or
+    the lazy form. Only the lines around the rows change, so converting back
+    and forth gives the same files. Also refreshes the index of static files
+    after hand edits."""
+    fns = glob.glob('./src/lang/*.rs')
+    touched = 0
+    for fn in fns:
+        content = set_form(open(fn, encoding='utf8').read(), static)
+        touched += write_if_changed(fn, content)
+    print('%d of %d files changed' % (touched, len(fns)))
 
 
-main()
+if __name__ == '__main__':
+    main()
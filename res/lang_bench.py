@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+# Compare the two forms of the language tables emitted by lang.py on the
+# current key set, run from the repository root like lang.py:
+#
+# lazy:   a HashMap collected from the rows on the first lookup in a language
+# static: the rows as const data with an index sorted by key, binary searched
+#
+# Python only models the shape of the Rust costs, dict for HashMap and bisect
+# for binary_search_by, the numbers compare the two forms, not the languages.
+#
+# python3 res/lang_bench.py
+# python3 res/lang_bench.py -r 20 -o bench.json
+
+import os
+import sys
+import glob
+import json
+import bisect
+import argparse
+import platform
+import time
+
+import lang
+
+
+def load_tables():
+    """Return {lang: rows} for every language, rows as in the lazy form."""
+    tables = {}
+    for fn in sorted(glob.glob('./src/lang/*.rs')):
+        name = os.path.basename(fn)[:-3]
+        if name != 'template':
+            tables[name] = list(lang.get_lang(name).items())
+    return tables
+
+
+def best_of(repeat, fn):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def bench(tables, keys, repeat):
+    """Time building every table and looking up every key in each of them,
+    half of the keys are misses as for untranslated strings."""
+    lookups = keys + ['%s (missing)' % k for k in keys]
+    lazy = {name: dict(rows) for name, rows in tables.items()}
+    static = {name: (rows, sorted(range(len(rows)), key=lambda i: rows[i][0]))
+              for name, rows in tables.items()}
+
+    def init_lazy():
+        for rows in tables.values():
+            dict(rows)
+
+    def lookup_lazy():
+        for m in lazy.values():
+            for k in lookups:
+                m.get(k)
+
+    def lookup_static():
+        for rows, index in static.values():
+            key = lambda r: rows[r][0]
+            for k in lookups:
+                i = bisect.bisect_right(index, k, key=key)
+                if i and rows[index[i - 1]][0] == k:
+                    rows[index[i - 1]][1]
+
+    count = len(tables) * len(lookups)
+    init = best_of(repeat, init_lazy)
+    return {
+        'lazy': {
+            'init_seconds': round(init, 6),
+            'init_us_per_lang': round(init / len(tables) * 1e6, 2),
+            'lookup_ns': round(best_of(repeat, lookup_lazy) / count * 1e9, 1),
+        },
+        # the rows and the index are the const data, nothing to build
+        'static': {
+            'init_seconds': 0,
+            'init_us_per_lang': 0,
+            'lookup_ns': round(best_of(repeat, lookup_static) / count * 1e9, 1),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the lazy and static language tables.")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Runs per measure, the best is kept. Default is 5.")
+    parser.add_argument("-o", "--output", type=str, help="Write the json report to this file.")
+    args = parser.parse_args()
+
+    tables = load_tables()
+    keys = list(lang.get_lang('template'))
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'languages': len(tables),
+        'keys': len(keys),
+        'rows': sum(len(rows) for rows in tables.values()),
+    }
+    report.update(bench(tables, keys, args.repeat))
+    print(f"{report['languages']} languages, {report['rows']} rows: "
+          f"lazy init {report['lazy']['init_us_per_lang']}us/lang, "
+          f"lookup lazy {report['lazy']['lookup_ns']}ns static {report['static']['lookup_ns']}ns",
+          file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Benchmark preprocess.py on synthetic dist directories, on any OS.
+# The Package and CustomActions templates are copied to a temporary folder,
+# so the checkout is left untouched, and the `init_global_vars` probe, which
+# runs the windows executable, is stubbed.
+#
+# python3 bench.py                         # 1k, 10k and 50k files
+# python3 bench.py -n 10000 --arp -o bench.json
+
+import os
+import io
+import sys
+import json
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import preprocess
+
+SIZES = [1000, 10000, 50000]
+# (directory, extension) pools of a flutter windows bundle
+DIRS = [
+    ("", ".dll"),
+    ("data", ".dat"),
+    ("data/flutter_assets/assets", ".png"),
+    ("data/flutter_assets/assets", ".svg"),
+    ("data/flutter_assets/fonts", ".ttf"),
+    ("data/flutter_assets/packages", ".json"),
+]
+
+
+def make_dist(folder, count, app_name, seed=0):
+    """Create count files in folder, return their total size in bytes."""
+    rnd = random.Random(seed)
+    total = 0
+    Path(folder).mkdir(parents=True)
+    # the main executable is skipped by the component generator
+    Path(folder, f"{app_name}.exe").write_bytes(b"MZ")
+    for i in range(count - 1):
+        directory, ext = DIRS[i % len(DIRS)]
+        if directory.startswith("data/flutter_assets/"):
+            # spread the assets over sub folders, like packages do
+            directory = f"{directory}/p{i % 97}"
+        path = Path(folder, directory, f"f{i}{ext}")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        content = rnd.randbytes(rnd.randint(16, 1024))
+        path.write_bytes(content)
+        total += len(content)
+    return total
+
+
+def make_workdir(root):
+    """Copy what preprocess.py edits, laid out as in the repository."""
+    src = Path(__file__).resolve().parent
+    shutil.copytree(src.joinpath("Package"), Path(root, "msi", "Package"))
+    shutil.copytree(src.joinpath("CustomActions"), Path(root, "msi", "CustomActions"))
+    shutil.copy(src.parent.joinpath("icon.ico"), Path(root, "icon.ico"))
+    return Path(root, "msi")
+
+
+def stub_init_global_vars(dist_dir, app_name, args):
+    preprocess.g_version = (args.version or "1.4.0").replace("-", ".")
+    if preprocess.g_version.count(".") == 2:
+        preprocess.g_version = f"{preprocess.g_version}.{args.revision_version}"
+    preprocess.g_build_date = "2024-01-01 00:00"
+    return True
+
+
+def bench(count, app_name, arp):
+    root = tempfile.mkdtemp(prefix="rustdesk-msi-bench-")
+    cwd = os.getcwd()
+    argv0 = sys.argv[0]
+    try:
+        size = make_dist(os.path.join(root, "dist"), count, app_name)
+        msi_dir = make_workdir(root)
+        # preprocess.py resolves everything from its own location and the cwd
+        sys.argv[0] = str(msi_dir.joinpath("preprocess.py"))
+        os.chdir(msi_dir)
+        argv = ["-d", "../dist", "--app-name", app_name, "--revision-version", "1"]
+        if arp:
+            argv.append("--arp")
+        timings = {}
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            preprocess.main(argv, timings)
+            total = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+        sys.argv[0] = argv0
+        shutil.rmtree(root)
+    return {
+        "files": count,
+        "bytes": size,
+        "steps": {k: round(v, 4) for k, v in timings.items()},
+        "total_seconds": round(total, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark msi preprocess.py.")
+    parser.add_argument(
+        "-n",
+        "--files",
+        type=int,
+        action="append",
+        help=f"Files in the synthetic dist directory, repeatable. Default is {SIZES}.",
+    )
+    parser.add_argument(
+        "--app-name",
+        type=str,
+        default="BenchDesk",
+        help="The app name, a custom name also runs the rebranding. Default is BenchDesk.",
+    )
+    parser.add_argument("--arp", action="store_true", help="Also generate the ARP registry values.")
+    parser.add_argument("-o", "--output", type=str, help="Write the json report to this file.")
+    args = parser.parse_args()
+
+    preprocess.init_global_vars = stub_init_global_vars
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "app_name": args.app_name,
+        "arp": args.arp,
+        "runs": [],
+    }
+    for count in args.files or SIZES:
+        run = bench(count, args.app_name, args.arp)
+        slowest = max(run["steps"], key=run["steps"].get)
+        print(
+            f"{count} files: {run['total_seconds']}s, slowest step {slowest} {run['steps'][slowest]}s",
+            file=sys.stderr,
+        )
+        report["runs"].append(run)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
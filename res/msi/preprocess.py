@@ -2,20 +2,27 @@
 # -*- coding: utf-8 -*-
 
 import json
+import os
 import sys
+import hashlib
 import uuid
 import argparse
 import datetime
 import subprocess
 import re
+import time
 import platform
 from pathlib import Path
-from itertools import chain
 import shutil
 
 g_indent_unit = "\t"
 g_version = ""
 g_build_date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+# The Package documents, loaded once and written once at the end.
+g_documents = None
+# The files of the dist directory, scanned once, see `get_dist_manifest()`.
+g_dist_manifest = None
+g_dist_manifest_file = None
 
 # Replace the following links with your own in the custom arp properties.
 # https://learn.microsoft.com/en-us/windows/win32/msi/property-reference
@@ -88,54 +95,179 @@ def make_parser():
         default="PURSLANE",
         help="The app manufacturer.",
     )
+    parser.add_argument(
+        "--dist-manifest",
+        type=str,
+        default="",
+        help="Save the dist directory manifest with sha256 checksums to this json file. "
+        "Checksums of files with unchanged size and mtime are reused from it.",
+    )
     return parser
 
 
-def read_lines_and_start_index(file_path, tag_start, tag_end):
-    with open(file_path, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-    index_start = -1
-    index_end = -1
-    for i, line in enumerate(lines):
-        if tag_start in line:
-            index_start = i
-        if tag_end in line:
-            index_end = i
-
-    if index_start == -1:
-        print(f'Error: start tag "{tag_start}" not found')
-        return None, None
-    if index_end == -1:
-        print(f'Error: end tag "{tag_end}" not found')
-        return None, None
-    return lines, index_start
+class WixDocuments:
+    """The .wxs/.wxi files edited by the generators.
+
+    Each file is read once, on first use, and all of its `<!--$...$-->` tag
+    markers are indexed in the same scan. Generators edit the lines in
+    memory, `save()` writes every changed file once, together with the other
+    files set with `set_text()`, so a failed step leaves every file untouched.
+    """
+
+    tag_pattern = re.compile(r"<!--\$\w+\$-->")
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.docs = {}
+        self.texts = {}
+
+    def get(self, filename):
+        doc = self.docs.get(filename)
+        if doc is None:
+            with open(self.root.joinpath(filename), "r", encoding="utf-8") as f:
+                lines = f.readlines()
+            tags = {}
+            for i, line in enumerate(lines):
+                for tag in self.tag_pattern.findall(line):
+                    tags[tag] = i
+            doc = {"lines": lines, "tags": tags, "changed": False}
+            self.docs[filename] = doc
+        return doc
+
+    def lines_and_start_index(self, filename, tag_start, tag_end):
+        doc = self.get(filename)
+        if tag_start not in doc["tags"]:
+            print(f'Error: start tag "{tag_start}" not found')
+            return None, None
+        if tag_end not in doc["tags"]:
+            print(f'Error: end tag "{tag_end}" not found')
+            return None, None
+        return doc["lines"], doc["tags"][tag_start]
+
+    def inserted(self, filename, index, count):
+        """Record that count lines were inserted after line index."""
+        doc = self.docs[filename]
+        for tag, i in doc["tags"].items():
+            if i > index:
+                doc["tags"][tag] = i + count
+        doc["changed"] = doc["changed"] or count != 0
+
+    def set_text(self, filename, text):
+        """Replace the content of a file which is not a document, on `save()`."""
+        self.texts[filename] = text
+
+    def save(self):
+        for filename, doc in self.docs.items():
+            if doc["changed"]:
+                with open(self.root.joinpath(filename), "w", encoding="utf-8") as f:
+                    f.writelines(doc["lines"])
+                doc["changed"] = False
+        for filename, text in self.texts.items():
+            with open(self.root.joinpath(filename), "w", encoding="utf-8") as f:
+                f.write(text)
+        self.texts = {}
+
+
+def scan_dist_dir(dist_dir, with_hash=False, previous=None):
+    """Walk dist_dir once with `os.scandir`.
+
+    Returns the files as `{"path", "dir", "size", "mtime_ns"}` dicts, with
+    posix paths relative to dist_dir, grouped by directory and sorted. With
+    `with_hash`, a "sha256" is added, reused from the `previous` entry of
+    the same path when its size and mtime did not change.
+    """
+    previous = {e["path"]: e for e in previous or []} if with_hash else {}
+    entries = []
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(dist_dir, rel_dir)) as it:
+            for entry in it:
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if entry.is_dir():
+                    stack.append(rel)
+                elif entry.is_file():
+                    st = entry.stat()
+                    item = {
+                        "path": rel,
+                        "dir": rel_dir or ".",
+                        "size": st.st_size,
+                        "mtime_ns": st.st_mtime_ns,
+                    }
+                    if with_hash:
+                        last = previous.get(rel)
+                        if last and (last["size"], last["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+                            item["sha256"] = last["sha256"]
+                        else:
+                            item["sha256"] = file_sha256(entry.path)
+                    entries.append(item)
+    entries.sort(key=lambda e: (Path(e["dir"]).parts, e["path"]))
+    return entries
+
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def get_dist_manifest(dist_dir):
+    """The manifest shared by all steps, scanned on first use."""
+    global g_dist_manifest
+    if g_dist_manifest is None:
+        previous = None
+        if g_dist_manifest_file and os.path.isfile(g_dist_manifest_file):
+            with open(g_dist_manifest_file, "r", encoding="utf-8") as f:
+                previous = json.load(f)["files"]
+        g_dist_manifest = scan_dist_dir(dist_dir, bool(g_dist_manifest_file), previous)
+    return g_dist_manifest
+
+
+def save_dist_manifest(dist_dir):
+    with open(g_dist_manifest_file, "w", encoding="utf-8") as f:
+        json.dump({"dist_dir": Path(dist_dir).as_posix(), "files": get_dist_manifest(dist_dir)},
+                  f, indent=1)
+
+
+def component_guid(app_name, identity):
+    # Stable across builds, so unchanged inputs give identical .wxs files and
+    # components keep their GUIDs between versions, as Windows Installer
+    # expects. identity is unique per component, e.g. its install path.
+    return uuid.uuid5(uuid.NAMESPACE_OID, f"{app_name}.exe/{identity}")
 
 
 def insert_components_between_tags(lines, index_start, app_name, dist_dir):
     indent = g_indent_unit * 3
     path = Path(dist_dir)
-    idx = 1
-    for file_path in path.glob("**/*"):
-        if file_path.is_file():
-            if file_path.name.lower() == f"{app_name}.exe".lower():
-                continue
-
-            subdir = str(file_path.parent.relative_to(path))
-            dir_attr = ""
-            if subdir != ".":
-                dir_attr = f'Subdirectory="{subdir}"'
-
+    # The manifest is grouped by directory, so each directory's attribute is
+    # built once and its components are emitted together.
+    dirs = {}
+    for entry in get_dist_manifest(dist_dir):
+        if Path(entry["path"]).name.lower() == f"{app_name}.exe".lower():
+            continue
+        dirs.setdefault(entry["dir"], []).append(entry["path"])
+
+    to_insert_lines = []
+    for subdir, files in dirs.items():
+        dir_attr = ""
+        if subdir != ".":
+            dir_attr = f'Subdirectory="{Path(subdir)}"'
+        for rel_path in files:
+            file_path = path.joinpath(rel_path)
             # Don't generate Component Id and File Id like 'Component_{idx}' and 'File_{idx}'
             # because it will cause error
             # "Error WIX0130	The primary key 'xxxx' is duplicated in table 'Directory'"
-            to_insert_lines = f"""
-{indent}<Component Guid="{uuid.uuid4()}" {dir_attr}>
+            guid = component_guid(app_name, f"file:{rel_path}")
+            to_insert_lines.append(
+                f"""{indent}<Component Guid="{guid}" {dir_attr}>
 {indent}{g_indent_unit}<File Source="{file_path.as_posix()}" KeyPath="yes" Checksum="yes" />
 {indent}</Component>
 """
-            lines.insert(index_start + 1, to_insert_lines[1:])
-            index_start += 1
-            idx += 1
+            )
+    # Splice once, inserting line by line shifts the whole list for every file.
+    lines[index_start + 1:index_start + 1] = to_insert_lines
     return True
 
 
@@ -152,7 +284,7 @@ def gen_auto_component(app_name, dist_dir):
 
 def gen_pre_vars(args, dist_dir):
     def func(lines, index_start):
-        upgrade_code = uuid.uuid5(uuid.NAMESPACE_OID, app_name + ".exe")
+        upgrade_code = uuid.uuid5(uuid.NAMESPACE_OID, args.app_name + ".exe")
 
         indent = g_indent_unit * 1
         to_insert_lines = [
@@ -179,35 +311,13 @@ def gen_pre_vars(args, dist_dir):
     )
 
 
-def replace_app_name_in_langs(app_name):
-    langs_dir = Path(sys.argv[0]).parent.joinpath("Package/Language")
-    for file_path in langs_dir.glob("*.wxl"):
-        with open(file_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-        for i, line in enumerate(lines):
-            lines[i] = line.replace("RustDesk", app_name)
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.writelines(lines)
-
-def replace_app_name_in_custom_actions(app_name):
-    custion_actions_dir = Path(sys.argv[0]).parent.joinpath("CustomActions")
-    for file_path in chain(custion_actions_dir.glob("*.cpp"), custion_actions_dir.glob("*.h")):
-        with open(file_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-        for i, line in enumerate(lines):
-            line = re.sub(r"\bRustDesk\b", app_name, line)
-            line = line.replace(f"{app_name} v4 Printer Driver", "RustDesk v4 Printer Driver")
-            lines[i] = line
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.writelines(lines)
-
-def gen_upgrade_info():
+def gen_upgrade_info(app_name):
     def func(lines, index_start):
         indent = g_indent_unit * 3
 
         vs = g_version.split(".")
         major = vs[0]
-        upgrade_id = uuid.uuid4()
+        upgrade_id = component_guid(app_name, f"upgrade:{major}")
         to_insert_lines = [
             f'{indent}<Upgrade Id="{upgrade_id}">\n',
             f'{indent}{g_indent_unit}<UpgradeVersion Property="OLD_VERSION_FOUND" Minimum="{major}.0.0" Maximum="{major}.99.99" IncludeMinimum="yes" IncludeMaximum="yes" OnlyDetect="no" IgnoreRemoveFailure="yes" MigrateFeatures="yes" />\n',
@@ -292,14 +402,7 @@ def gen_custom_ARPSYSTEMCOMPONENT_False(args):
 
 
 def get_folder_size(folder_path):
-    total_size = 0
-
-    folder = Path(folder_path)
-    for file in folder.glob("**/*"):
-        if file.is_file():
-            total_size += file.stat().st_size
-
-    return total_size
+    return sum(entry["size"] for entry in get_dist_manifest(folder_path))
 
 
 def gen_custom_ARPSYSTEMCOMPONENT_True(args, dist_dir):
@@ -426,15 +529,14 @@ def gen_conn_type(args):
     )
 
 def gen_content_between_tags(filename, tag_start, tag_end, func):
-    target_file = Path(sys.argv[0]).parent.joinpath(filename)
-    lines, index_start = read_lines_and_start_index(target_file, tag_start, tag_end)
+    lines, index_start = g_documents.lines_and_start_index(filename, tag_start, tag_end)
     if lines is None:
         return False
 
+    # funcs only insert lines right after the start tag
+    count = len(lines)
     func(lines, index_start)
-
-    with open(target_file, "w", encoding="utf-8") as f:
-        f.writelines(lines)
+    g_documents.inserted(filename, index_start, len(lines) - count)
 
     return True
 
@@ -489,70 +591,139 @@ def init_global_vars(dist_dir, app_name, args):
     return True
 
 
-def update_license_file(app_name):
-    if app_name == "RustDesk":
-        return
-    license_file = Path(sys.argv[0]).parent.joinpath("Package/License.rtf")
-    with open(license_file, "r", encoding="utf-8") as f:
-        license_content = f.read()
-    license_content = license_content.replace("website rustdesk.com and other ", "")
-    license_content = license_content.replace("RustDesk", app_name)
-    license_content = re.sub("Purslane Ltd", app_name, license_content, flags=re.IGNORECASE)
-    with open(license_file, "w", encoding="utf-8") as f:
-        f.write(license_content)
-
-
-def replace_component_guids_in_wxs():
-    langs_dir = Path(sys.argv[0]).parent.joinpath("Package")
-    for file_path in langs_dir.glob("**/*.wxs"):
-        with open(file_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
+# Rebranding for custom clients. Each kind of file gets its substitutions
+# compiled into one regex, applied in a single pass over the whole file.
+# Files are only written when they changed.
 
-        # <Component Id="Product.Registry.DefaultIcon" Guid="6DBF2690-0955-4C6A-940F-634DDA503F49">
-        for i, line in enumerate(lines):
-            match = re.search(r'Component.+Guid="([^"]+)"', line)
-            if match:
-                lines[i] = re.sub(r'Guid="[^"]+"', f'Guid="{uuid.uuid4()}"', line)
 
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.writelines(lines)
+def compile_substitutions(subs):
+    """Combine `[(pattern, replacement)]` into one function of the text.
 
+    A replacement is a string, or a function of the match of its own
+    pattern. At each position the first matching pattern wins.
+    """
+    combined = re.compile("|".join(f"(?P<s{i}>{p})" for i, (p, _) in enumerate(subs)))
+    singles = [re.compile(p) for p, _ in subs]
 
-if __name__ == "__main__":
-    parser = make_parser()
-    args = parser.parse_args()
-
-    app_name = args.app_name
-    dist_dir = Path(sys.argv[0]).parent.joinpath(args.dist_dir).resolve()
+    def replace(m):
+        i = int(m.lastgroup[1:])
+        r = subs[i][1]
+        return r if isinstance(r, str) else r(singles[i].match(m.group()))
 
-    if not prepare_resources():
-        sys.exit(-1)
+    return lambda text: combined.sub(replace, text)
 
-    if not init_global_vars(dist_dir, app_name, args):
-        sys.exit(-1)
 
-    update_license_file(app_name)
+def rebrand_rules(app_name):
+    """`[(glob patterns, substitutions)]` relative to the script directory."""
+    def component_guid_sub(m):
+        # <Component Id="Product.Registry.DefaultIcon" Guid="6DBF2690-0955-4C6A-940F-634DDA503F49">
+        # every GUID of the line is replaced, the original GUID identifies
+        # the component, it is unique
+        return re.sub(
+            r'Guid="([^"]+)"',
+            lambda g: f'Guid="{component_guid(app_name, "component:" + g.group(1).upper())}"',
+            m.group(),
+        )
 
-    if not gen_pre_vars(args, dist_dir):
-        sys.exit(-1)
+    app = re.escape(app_name)
+    return [
+        (["Package/Language/*.wxl"], [(r"RustDesk", app_name)]),
+        (
+            ["CustomActions/*.cpp", "CustomActions/*.h"],
+            [
+                # the printer driver keeps its name
+                (r"RustDesk v4 Printer Driver", "RustDesk v4 Printer Driver"),
+                (rf"{app} v4 Printer Driver", "RustDesk v4 Printer Driver"),
+                (r"\bRustDesk\b", app_name),
+            ],
+        ),
+        (
+            ["Package/License.rtf"],
+            [
+                (r"website rustdesk\.com and other ", ""),
+                (r"RustDesk", app_name),
+                (r"(?i:Purslane Ltd)", app_name),
+            ],
+        ),
+        # the whole line, the match can only start at the line start
+        (["Package/**/*.wxs"], [(r'[^\n]*Component[^\n]+Guid="[^"]+"[^\n]*', component_guid_sub)]),
+    ]
 
-    if app_name != "RustDesk":
-        replace_component_guids_in_wxs()
 
-    if not gen_upgrade_info():
-        sys.exit(-1)
+def rebrand(app_name):
+    """Apply `rebrand_rules` in `g_documents`, nothing is written before its
+    `save()`.
 
-    if not gen_custom_ARPSYSTEMCOMPONENT(args, dist_dir):
-        sys.exit(-1)
+    Returns the number of files changed.
+    """
+    if app_name == "RustDesk":
+        return 0
+    root = g_documents.root
+    changed = 0
+    for patterns, subs in rebrand_rules(app_name):
+        substitute = compile_substitutions(subs)
+        for pattern in patterns:
+            for file_path in sorted(root.glob(pattern)):
+                filename = file_path.relative_to(root).as_posix()
+                if file_path.suffix == ".wxs":
+                    doc = g_documents.get(filename)
+                    text = "".join(doc["lines"])
+                else:
+                    with open(file_path, "r", encoding="utf-8") as f:
+                        text = f.read()
+                new_text = substitute(text)
+                if new_text == text:
+                    continue
+                changed += 1
+                if file_path.suffix == ".wxs":
+                    # line count is unchanged, the tag indexes stay valid
+                    doc["lines"] = new_text.splitlines(keepends=True)
+                    doc["changed"] = True
+                else:
+                    g_documents.set_text(filename, new_text)
+    return changed
+
+
+def main(argv=None, timings=None):
+    """Run all steps, `timings` gets the seconds spent in each of them."""
+    global g_documents
+    global g_dist_manifest
+    global g_dist_manifest_file
 
-    if not gen_conn_type(args):
-        sys.exit(-1)
+    parser = make_parser()
+    args = parser.parse_args(argv)
 
-    if not gen_auto_component(app_name, dist_dir):
-        sys.exit(-1)
+    app_name = args.app_name
+    dist_dir = Path(sys.argv[0]).parent.joinpath(args.dist_dir).resolve()
+    g_documents = WixDocuments(Path(sys.argv[0]).parent)
+    g_dist_manifest = None
+    g_dist_manifest_file = args.dist_manifest or None
+
+    def save():
+        g_documents.save()
+        if g_dist_manifest_file:
+            save_dist_manifest(dist_dir)
+
+    steps = [
+        ("prepare_resources", prepare_resources),
+        ("init_global_vars", lambda: init_global_vars(dist_dir, app_name, args)),
+        ("rebrand", lambda: print(f"Rebranded {rebrand(app_name)} files")),
+        ("gen_pre_vars", lambda: gen_pre_vars(args, dist_dir)),
+        ("gen_upgrade_info", lambda: gen_upgrade_info(app_name)),
+        ("gen_custom_ARPSYSTEMCOMPONENT", lambda: gen_custom_ARPSYSTEMCOMPONENT(args, dist_dir)),
+        ("gen_conn_type", lambda: gen_conn_type(args)),
+        ("gen_auto_component", lambda: gen_auto_component(app_name, dist_dir)),
+        ("gen_custom_dialog_bitmaps", gen_custom_dialog_bitmaps),
+        ("save", save),
+    ]
+    for name, step in steps:
+        start = time.perf_counter()
+        ok = step()
+        if timings is not None:
+            timings[name] = time.perf_counter() - start
+        if ok is False:
+            sys.exit(-1)
 
-    if not gen_custom_dialog_bitmaps():
-        sys.exit(-1)
 
-    replace_app_name_in_langs(args.app_name)
-    replace_app_name_in_custom_actions(args.app_name)
+if __name__ == "__main__":
+    main()
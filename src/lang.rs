@@ -1,5 +1,4 @@
 use hbb_common::regex::Regex;
-use std::ops::Deref;
 
 mod ar;
 mod be;
@@ -95,6 +94,96 @@ pub const LANGS: &[(&str, &str)] = &[
     ("ge", "ქართული"),
 ];
 
+// A translation table as const data, written by `python3 res/lang.py static`.
+// The rows keep the order of the source file, index lists them sorted by key,
+// so nothing is built at runtime. The table! macro checks the index when
+// compiling.
+pub struct Table {
+    pub rows: &'static [(&'static str, &'static str)],
+    pub index: &'static [u16],
+}
+
+macro_rules! table {
+    ($rows:expr, $index:expr $(,)?) => {{
+        const ROWS: &[(&str, &str)] = $rows;
+        const INDEX: &[u16] = $index;
+        const _: () = assert!(
+            crate::lang::is_sorted_index::<{ ROWS.len() }>(ROWS, INDEX),
+            "stale index, run python3 res/lang.py static"
+        );
+        &crate::lang::Table {
+            rows: ROWS,
+            index: INDEX,
+        }
+    }};
+}
+pub(crate) use table;
+
+// Whether key x of row a sorts before key y of row b, by key then by row, so
+// of duplicated keys the last row wins as when collecting into a HashMap.
+const fn key_less(x: &[u8], a: u16, y: &[u8], b: u16) -> bool {
+    let mut i = 0;
+    while i < x.len() && i < y.len() {
+        if x[i] != y[i] {
+            return x[i] < y[i];
+        }
+        i += 1;
+    }
+    if x.len() != y.len() {
+        return x.len() < y.len();
+    }
+    a < b
+}
+
+// Whether index lists every row once, in key_less order. key_less is strict,
+// so N increasing row numbers below N are each row once.
+const fn is_sorted_index<const N: usize>(rows: &[(&str, &str)], index: &[u16]) -> bool {
+    if index.len() != N {
+        return false;
+    }
+    let mut prev: &[u8] = &[];
+    let mut i = 0;
+    while i < N {
+        let r = index[i];
+        if r as usize >= N {
+            return false;
+        }
+        let key = rows[r as usize].0.as_bytes();
+        if i > 0 && !key_less(prev, index[i - 1], key, r) {
+            return false;
+        }
+        prev = key;
+        i += 1;
+    }
+    true
+}
+
+// Lookup in either form of the language tables, see res/lang.py.
+trait Lookup {
+    fn lookup(&self, key: &str) -> Option<&'static str>;
+}
+
+impl Lookup for std::collections::HashMap<&'static str, &'static str> {
+    fn lookup(&self, key: &str) -> Option<&'static str> {
+        self.get(key).copied()
+    }
+}
+
+impl Lookup for Table {
+    fn lookup(&self, key: &str) -> Option<&'static str> {
+        // past the last row with this key
+        let i = self
+            .index
+            .partition_point(|&r| self.rows[r as usize].0 <= key);
+        let (k, v) = self.rows[self.index[i.checked_sub(1)?] as usize];
+        if k == key {
+            Some(v)
+        } else {
+            None
+        }
+    }
+}
+
 #[cfg(not(any(target_os = "android", target_os = "ios")))]
 pub fn translate(name: String) -> String {
     let locale = sys_locale::get_locale().unwrap_or_default();
@@ -124,53 +213,53 @@ pub fn translate_locale(name: String, locale: &str) -> String {
             .to_owned();
     }
     let lang = lang.to_lowercase();
-    let m = match lang.as_str() {
-        "fr" => fr::T.deref(),
-        "zh-cn" => cn::T.deref(),
-        "it" => it::T.deref(),
-        "zh-tw" => tw::T.deref(),
-        "de" => de::T.deref(),
-        "nb" => nb::T.deref(),
-        "nl" => nl::T.deref(),
-        "es" => es::T.deref(),
-        "et" => et::T.deref(),
-        "eu" => eu::T.deref(),
-        "hu" => hu::T.deref(),
-        "ru" => ru::T.deref(),
-        "eo" => eo::T.deref(),
-        "id" => id::T.deref(),
-        "br" => ptbr::T.deref(),
-        "pt" => ptbr::T.deref(),
-        "tr" => tr::T.deref(),
-        "cs" => cs::T.deref(),
-        "da" => da::T.deref(),
-        "sk" => sk::T.deref(),
-        "vn" => vn::T.deref(),
-        "pl" => pl::T.deref(),
-        "ja" => ja::T.deref(),
-        "ko" => ko::T.deref(),
-        "kz" => kz::T.deref(),
-        "uk" => uk::T.deref(),
-        "fa" => fa::T.deref(),
-        "ca" => ca::T.deref(),
-        "el" => el::T.deref(),
-        "sv" => sv::T.deref(),
-        "sq" => sq::T.deref(),
-        "sr" => sr::T.deref(),
-        "th" => th::T.deref(),
-        "sl" => sl::T.deref(),
-        "ro" => ro::T.deref(),
-        "lt" => lt::T.deref(),
-        "lv" => lv::T.deref(),
-        "ar" => ar::T.deref(),
-        "bg" => bg::T.deref(),
-        "be" => be::T.deref(),
-        "he" => he::T.deref(),
-        "hr" => hr::T.deref(),
-        "sc" => sc::T.deref(),
-        "ta" => ta::T.deref(),
-        "ge" => ge::T.deref(),
-        _ => en::T.deref(),
+    let m: &dyn Lookup = match lang.as_str() {
+        "fr" => &*fr::T,
+        "zh-cn" => &*cn::T,
+        "it" => &*it::T,
+        "zh-tw" => &*tw::T,
+        "de" => &*de::T,
+        "nb" => &*nb::T,
+        "nl" => &*nl::T,
+        "es" => &*es::T,
+        "et" => &*et::T,
+        "eu" => &*eu::T,
+        "hu" => &*hu::T,
+        "ru" => &*ru::T,
+        "eo" => &*eo::T,
+        "id" => &*id::T,
+        "br" => &*ptbr::T,
+        "pt" => &*ptbr::T,
+        "tr" => &*tr::T,
+        "cs" => &*cs::T,
+        "da" => &*da::T,
+        "sk" => &*sk::T,
+        "vn" => &*vn::T,
+        "pl" => &*pl::T,
+        "ja" => &*ja::T,
+        "ko" => &*ko::T,
+        "kz" => &*kz::T,
+        "uk" => &*uk::T,
+        "fa" => &*fa::T,
+        "ca" => &*ca::T,
+        "el" => &*el::T,
+        "sv" => &*sv::T,
+        "sq" => &*sq::T,
+        "sr" => &*sr::T,
+        "th" => &*th::T,
+        "sl" => &*sl::T,
+        "ro" => &*ro::T,
+        "lt" => &*lt::T,
+        "lv" => &*lv::T,
+        "ar" => &*ar::T,
+        "bg" => &*bg::T,
+        "be" => &*be::T,
+        "he" => &*he::T,
+        "hr" => &*hr::T,
+        "sc" => &*sc::T,
+        "ta" => &*ta::T,
+        "ge" => &*ge::T,
+        _ => &*en::T,
     };
     let (name, placeholder_value) = extract_placeholder(&name);
     let replace = |s: &&str| {
@@ -188,15 +277,15 @@ pub fn translate_locale(name: String, locale: &str) -> String {
         }
         s
     };
-    if let Some(v) = m.get(&name as &str) {
+    if let Some(v) = m.lookup(&name) {
         if !v.is_empty() {
-            return replace(v);
+            return replace(&v);
         }
     }
     if lang != "en" {
-        if let Some(v) = en::T.get(&name as &str) {
+        if let Some(v) = en::T.lookup(&name) {
             if !v.is_empty() {
-                return replace(v);
+                return replace(&v);
             }
         }
     }
@@ -244,4 +333,29 @@ mod test {
             ("{} times {4} makes {8}".to_string(), Some("2".to_string()))
         );
     }
+
+    #[test]
+    fn test_table() {
+        use super::Lookup;
+
+        let t: &super::Table = super::table!(
+            &[
+                ("Status", ""),
+                ("Copy", "Copy"),
+                ("", "empty"),
+                ("Copy", "Kopieren"),
+            ],
+            &[2, 1, 3, 0],
+        );
+        assert_eq!(t.lookup("Copy"), Some("Kopieren"));
+        assert_eq!(t.lookup("Status"), Some(""));
+        assert_eq!(t.lookup(""), Some("empty"));
+        assert_eq!(t.lookup("Paste"), None);
+
+        let rows = &[("b", ""), ("a", "")];
+        assert!(super::is_sorted_index::<2>(rows, &[1, 0]));
+        assert!(!super::is_sorted_index::<2>(rows, &[0, 1]));
+        assert!(!super::is_sorted_index::<2>(rows, &[1, 1]));
+        assert!(!super::is_sorted_index::<2>(rows, &[1]));
+    }
 }
@@ -1,6 +1,5 @@
-lazy_static::lazy_static! {
-pub static ref T: std::collections::HashMap<&'static str, &'static str> =
-    [
+pub static T: &crate::lang::Table = crate::lang::table!(
+    &[
         ("Status", "Estat"),
         ("Your Desktop", "Aquest ordinador"),
         ("desk_tip", "Es pot accedir a aquest equip mitjançant les credencials:"),
@@ -687,5 +686,6 @@ pub static ref T: std::collections::HashMap<&'static str, &'static str> =
         ("screenshot-action-tip", ""),
         ("Save as", ""),
         ("Copy to clipboard", ""),
-    ].iter().cloned().collect();
-}
+    ],
+    &[573, 580, 55, 42, 629, 175, 499, 158, 392, 391, 390, 655, 287, 166, 52, 167, 222, 223, 233, 403, 16, 115, 516, 210, 410, 352, 620, 244, 103, 102, 101, 316, 416, 273, 49, 355, 646, 645, 440, 188, 362, 363, 619, 122, 556, 438, 113, 46, 515, 62, 259, 261, 618, 364, 527, 35, 170, 517, 193, 555, 267, 543, 417, 354, 606, 146, 147, 145, 33, 651, 64, 206, 406, 447, 498, 148, 93, 376, 17, 14, 209, 179, 80, 75, 265, 72, 542, 76, 307, 387, 324, 12, 319, 485, 685, 194, 156, 192, 155, 124, 111, 342, 340, 639, 539, 482, 437, 436, 435, 434, 94, 106, 369, 331, 350, 180, 182, 361, 493, 127, 177, 353, 374, 239, 176, 433, 325, 104, 276, 71, 537, 254, 648, 245, 616, 617, 230, 388, 422, 415, 579, 235, 99, 464, 463, 492, 368, 187, 25, 347, 562, 659, 23, 189, 178, 24, 345, 22, 367, 207, 314, 7, 636, 159, 50, 184, 566, 185, 73, 5, 596, 591, 504, 320, 567, 29, 31, 439, 292, 138, 133, 140, 139, 141, 299, 232, 274, 546, 484, 109, 196, 612, 344, 600, 601, 231, 378, 594, 321, 337, 160, 121, 520, 404, 529, 51, 291, 330, 398, 48, 278, 538, 519, 53, 132, 27, 26, 303, 327, 28, 30, 604, 671, 670, 502, 272, 334, 129, 130, 152, 668, 153, 154, 530, 531, 151, 57, 643, 236, 58, 205, 32, 382, 302, 614, 136, 377, 301, 249, 308, 343, 341, 558, 521, 163, 89, 169, 92, 168, 407, 128, 186, 212, 78, 198, 218, 637, 309, 456, 465, 429, 455, 322, 83, 574, 255, 257, 247, 514, 96, 581, 45, 587, 81, 357, 225, 615, 453, 483, 660, 550, 480, 263, 449, 100, 60, 264, 66, 473, 143, 253, 248, 250, 394, 396, 505, 277, 513, 551, 123, 494, 116, 375, 441, 605, 669, 503, 288, 589, 641, 3, 67, 227, 242, 243, 296, 298, 174, 588, 358, 260, 638, 383, 432, 195, 68, 297, 582, 77, 134, 372, 393, 560, 489, 202, 623, 528, 663, 44, 112, 371, 95, 351, 290, 451, 326, 592, 593, 4, 199, 86, 15, 446, 360, 131, 88, 518, 20, 332, 54, 181, 183, 214, 69, 90, 91, 164, 241, 165, 135, 19, 234, 547, 190, 420, 397, 633, 74, 262, 448, 315, 317, 454, 642, 65, 532, 252, 401, 208, 684, 336, 335, 271, 275, 379, 328, 120, 119, 405, 220, 333, 338, 586, 522, 97, 323, 487, 408, 488, 270, 87, 630, 349, 507, 10, 9, 635, 142, 450, 313, 590, 21, 203, 266, 85, 384, 329, 552, 126, 125, 117, 84, 63, 402, 43, 557, 237, 238, 294, 452, 512, 191, 110, 508, 305, 8, 365, 306, 0, 509, 34, 366, 444, 118, 430, 293, 79, 571, 431, 511, 481, 18, 219, 680, 681, 624, 548, 443, 173, 229, 339, 385, 289, 105, 256, 137, 540, 523, 61, 172, 268, 246, 13, 310, 418, 561, 215, 300, 258, 251, 82, 114, 490, 348, 346, 632, 359, 98, 224, 295, 200, 653, 491, 652, 650, 649, 662, 356, 553, 312, 395, 311, 611, 204, 226, 216, 213, 47, 468, 656, 559, 442, 622, 621, 414, 108, 197, 380, 381, 428, 41, 370, 634, 70, 228, 1, 457, 161, 36, 389, 597, 500, 157, 598, 39, 279, 280, 281, 609, 304, 286, 282, 285, 283, 284, 475, 474, 674, 541, 627, 628, 607, 501, 149, 411, 412, 150, 608, 6, 661, 602, 2, 425, 549, 679, 462, 373, 461, 459, 460, 458, 576, 575, 626, 625, 640, 578, 510, 107, 613, 399, 40, 563, 568, 466, 569, 570, 240, 144, 56, 269, 37, 427, 469, 506, 424, 631, 654, 486, 603, 479, 478, 599, 162, 11, 644, 386, 472, 584, 583, 585, 675, 664, 665, 666, 667, 564, 565, 524, 545, 525, 445, 471, 677, 676, 318, 413, 497, 496, 495, 678, 535, 536, 534, 683, 682, 554, 59, 171, 595, 467, 409, 426, 38, 419, 572, 526, 610, 657, 544, 423, 672, 673, 217, 470, 658, 421, 400, 647, 221, 211, 577, 201, 477, 476, 533],
+);
@@ -1,6 +1,5 @@
-lazy_static::lazy_static! {
-pub static ref T: std::collections::HashMap<&'static str, &'static str> =
-    [
+pub static T: &crate::lang::Table = crate::lang::table!(
+    &[
         ("desk_tip", "Your desktop can be accessed with this ID and password."),
         ("connecting_status", "Connecting to the RustDesk network..."),
         ("not_ready_status", "Not ready. Please check your connection"),
@@ -255,5 +254,6 @@ pub static ref T: std::collections::HashMap<&'static str, &'static str> =
         ("dont-show-again-tip", "Don't show this again"),
         ("screenshot-merged-screen-not-supported-tip", "Merging screenshots of multiple displays is currently not supported. Please switch to a single display and try again."),
         ("screenshot-action-tip", "Please select how to continue with the screenshot."),
-    ].iter().cloned().collect();
-}
+    ],
+    &[205, 11, 230, 171, 37, 52, 56, 28, 61, 79, 7, 114, 46, 6, 73, 75, 184, 43, 176, 47, 22, 16, 192, 98, 166, 48, 27, 108, 139, 138, 137, 136, 104, 113, 99, 68, 54, 131, 26, 150, 149, 45, 95, 80, 110, 217, 218, 55, 120, 178, 186, 8, 103, 9, 3, 92, 100, 78, 107, 29, 35, 187, 122, 119, 63, 109, 179, 42, 21, 41, 17, 96, 69, 71, 23, 143, 158, 31, 67, 62, 64, 124, 82, 140, 14, 116, 74, 123, 185, 142, 19, 177, 105, 10, 20, 39, 40, 57, 133, 66, 77, 81, 121, 101, 106, 24, 97, 30, 76, 18, 102, 5, 58, 59, 135, 165, 70, 180, 72, 65, 112, 111, 117, 25, 115, 153, 236, 15, 53, 144, 214, 172, 36, 215, 83, 84, 85, 223, 93, 90, 86, 89, 87, 88, 160, 159, 244, 191, 228, 229, 221, 173, 33, 128, 129, 34, 222, 1, 239, 219, 0, 196, 195, 91, 251, 118, 148, 146, 147, 145, 207, 206, 227, 226, 232, 209, 175, 225, 125, 4, 198, 201, 151, 202, 203, 60, 32, 12, 154, 174, 231, 235, 167, 220, 164, 163, 216, 38, 2, 233, 157, 211, 210, 212, 245, 241, 240, 242, 243, 199, 200, 181, 194, 182, 141, 156, 249, 248, 94, 130, 170, 169, 168, 250, 189, 190, 188, 253, 252, 197, 13, 44, 213, 152, 127, 132, 204, 183, 224, 237, 193, 246, 247, 50, 155, 238, 134, 126, 234, 51, 49, 208, 162, 161],
+);